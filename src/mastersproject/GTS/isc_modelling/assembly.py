@@ -0,0 +1,181 @@
+""" Assembly of the global system on a fixed sparsity pattern"""
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sps
+
+import porepy as pp
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalAssembler:
+    """Assemble the global system from a cached static part and a dynamic part
+
+    The terms are split in static terms, which are unchanged within a time step,
+    and dynamic terms, which change between Newton iterations (e.g. the contact
+    mechanics and aperture-dependent flow terms). The static terms are assembled
+    once per time step. In each iteration only the dynamic terms are assembled,
+    and the sum is written into the data array of a cached CSR matrix with a fixed
+    sparsity pattern, i.e. the union of the patterns of the two parts.
+
+    The positions of the dynamic entries in the pattern are reused as long as the
+    pattern of the dynamic part is unchanged. Dynamic entries outside the pattern
+    trigger a rebuild of the pattern.
+
+    Parameters
+    ----------
+    static_terms : List[str]
+        names of the terms that are unchanged within a time step.
+    """
+
+    def __init__(self, static_terms: List[str]):
+        self.static_filter = pp.assembler_filters.ListFilter(term_list=static_terms)
+        self.dynamic_filter = pp.assembler_filters.ListFilter(
+            term_list=["!" + term for term in static_terms]
+        )
+
+        # Static part, assembled once per time step
+        self._static_matrix: Optional[sps.csr_matrix] = None
+        self._static_rhs: Optional[np.ndarray] = None
+        # Static values on the pattern
+        self._static_data: Optional[np.ndarray] = None
+
+        # Fixed pattern. Keys are row * num_cols + col, increasing.
+        self._pattern_keys: Optional[np.ndarray] = None
+        self._pattern_indptr: Optional[np.ndarray] = None
+        self._pattern_indices: Optional[np.ndarray] = None
+        self._pattern_shape: Optional[Tuple[int, int]] = None
+        self.matrix: Optional[sps.csr_matrix] = None
+
+        # Positions of the dynamic entries in the pattern, and the dynamic pattern
+        self._dynamic_indptr: Optional[np.ndarray] = None
+        self._dynamic_indices: Optional[np.ndarray] = None
+        self._dynamic_positions: Optional[np.ndarray] = None
+
+        self.num_static_assemblies = 0
+        self.num_pattern_builds = 0
+
+    def invalidate(self) -> None:
+        """ Reassemble the static terms on the next call to assemble()"""
+        self._static_matrix = None
+
+    def assemble(self, assembler: pp.Assembler) -> Tuple[sps.csr_matrix, np.ndarray]:
+        """Assemble the global matrix and right-hand side
+
+        The returned matrix is overwritten in place by the next call.
+        """
+        if self._static_matrix is None:
+            A_s, b_s = assembler.assemble_matrix_rhs(
+                filt=self.static_filter, matrix_format="csr"
+            )
+            A_s = _canonical(A_s)
+            self._static_matrix, self._static_rhs = A_s, b_s
+            self.num_static_assemblies += 1
+
+            static_positions = self._find(A_s)
+            if static_positions is None:
+                self._pattern_keys = None
+            else:
+                self._static_data = np.zeros(self._pattern_keys.size)
+                self._static_data[static_positions] = A_s.data
+
+        A_d, b_d = assembler.assemble_matrix_rhs(
+            filt=self.dynamic_filter, matrix_format="csr"
+        )
+        A_d = _canonical(A_d)
+
+        positions = self._positions(A_d)
+        if positions is None:
+            self._build_pattern(A_d)
+            positions = self._positions(A_d)
+
+        data = self._static_data.copy()
+        data[positions] += A_d.data
+        if self.matrix is None or self.matrix.nnz != data.size:
+            # The cached matrix was modified structurally by the caller
+            self._build_matrix()
+        self.matrix.data[:] = data
+        return self.matrix, self._static_rhs + b_d
+
+    # --- Helper methods ---
+
+    def _positions(self, A: sps.csr_matrix) -> Optional[np.ndarray]:
+        """Positions of the entries of A in the pattern
+
+        Returns None if A has entries outside the pattern.
+        """
+        if self._pattern_keys is None:
+            return None
+        if (
+            self._dynamic_positions is not None
+            and np.array_equal(A.indptr, self._dynamic_indptr)
+            and np.array_equal(A.indices, self._dynamic_indices)
+        ):
+            return self._dynamic_positions
+
+        positions = self._find(A)
+        if positions is None:
+            return None
+
+        self._dynamic_indptr = A.indptr.copy()
+        self._dynamic_indices = A.indices.copy()
+        self._dynamic_positions = positions
+        return positions
+
+    def _find(self, A: sps.csr_matrix) -> Optional[np.ndarray]:
+        """ Positions of the entries of A in the pattern, or None if not found"""
+        if self._pattern_keys is None:
+            return None
+        keys = _keys(A)
+        positions = np.searchsorted(self._pattern_keys, keys)
+        positions[positions == self._pattern_keys.size] = 0
+        if not np.array_equal(self._pattern_keys[positions], keys):
+            return None
+        return positions
+
+    def _build_pattern(self, A_d: sps.csr_matrix) -> None:
+        """ Union of the static and dynamic patterns"""
+        A_s = self._static_matrix
+        pattern = _canonical(_structure(A_s) + _structure(A_d))
+        self._pattern_keys = _keys(pattern)
+        self._pattern_shape = pattern.shape
+        self._pattern_indptr, self._pattern_indices = pattern.indptr, pattern.indices
+
+        static_positions = self._find(A_s)
+        self._static_data = np.zeros(self._pattern_keys.size)
+        self._static_data[static_positions] = A_s.data
+        self._dynamic_positions = None
+        self.matrix = None
+        self.num_pattern_builds += 1
+        logger.info(f"Built assembly pattern with {self._pattern_keys.size} nonzeros")
+
+    def _build_matrix(self) -> None:
+        """ Matrix on the pattern, with its own index arrays"""
+        self.matrix = sps.csr_matrix(
+            (
+                np.zeros(self._pattern_keys.size),
+                self._pattern_indices.copy(),
+                self._pattern_indptr.copy(),
+            ),
+            shape=self._pattern_shape,
+        )
+
+
+def _canonical(A: sps.spmatrix) -> sps.csr_matrix:
+    """ CSR matrix with sorted indices and no duplicate entries"""
+    A = sps.csr_matrix(A)
+    A.sum_duplicates()
+    return A
+
+
+def _structure(A: sps.csr_matrix) -> sps.csr_matrix:
+    """ Sparsity pattern of A, with unit values"""
+    return sps.csr_matrix((np.ones(A.nnz), A.indices, A.indptr), shape=A.shape)
+
+
+def _keys(A: sps.csr_matrix) -> np.ndarray:
+    """ row * num_cols + col of each entry, increasing for canonical CSR"""
+    rows = np.repeat(np.arange(A.shape[0], dtype=np.int64), np.diff(A.indptr))
+    return rows * A.shape[1] + A.indices
@@ -0,0 +1,157 @@
+""" Dirichlet-type constraints on the degrees of freedom of the global system"""
+import logging
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import scipy.sparse as sps
+
+logger = logging.getLogger(__name__)
+
+
+class DofConstraint:
+    """Constraint x[dofs] = values on a set of degrees of freedom
+
+    The constrained and free dofs, and the restriction to the free dofs, are computed
+    once. The constraint is imposed either by identity rows written in place into
+    the global system, see apply(), or by elimination of the constrained dofs, see
+    eliminate() and prolong().
+
+    Parameters
+    ----------
+    dofs : np.ndarray
+        global indices of the constrained dofs
+    num_dofs : int
+        number of dofs of the global system
+    """
+
+    def __init__(self, dofs: np.ndarray, num_dofs: int):
+        self.dofs: np.ndarray = np.unique(np.asarray(dofs, dtype=int))
+        self.num_dofs = num_dofs
+
+        is_free = np.ones(num_dofs, dtype=bool)
+        is_free[self.dofs] = False
+        self.free_dofs: np.ndarray = np.flatnonzero(is_free)
+
+        # Restriction to the free dofs. The prolongation is the transpose.
+        num_free = self.free_dofs.size
+        self.restriction: sps.csr_matrix = sps.csr_matrix(
+            (np.ones(num_free), (np.arange(num_free), self.free_dofs)),
+            shape=(num_free, num_dofs),
+        )
+        self.prolongation: sps.csr_matrix = self.restriction.T.tocsr()
+
+        # Last sparsity pattern seen by apply()
+        self._indptr: Optional[np.ndarray] = None
+        self._indices: Optional[np.ndarray] = None
+        # Matrix with the missing diagonals of the constrained rows added, if any,
+        # and the positions of the entries of the last pattern in it
+        self._augmented: Optional[sps.csr_matrix] = None
+        self._source_positions: Optional[np.ndarray] = None
+        # Data positions of the constrained rows, and of their diagonal, in the
+        # last pattern, or in the augmented matrix
+        self._row_positions: Optional[np.ndarray] = None
+        self._diagonal_positions: Optional[np.ndarray] = None
+
+    def apply(
+        self, A: sps.csr_matrix, b: np.ndarray, values: Union[float, np.ndarray]
+    ) -> Tuple[sps.csr_matrix, np.ndarray]:
+        """Replace the constrained equations by x[dofs] = values
+
+        The identity rows are written in place into the data array of A, and b is
+        modified in place. If the diagonal of a constrained row is not in the
+        sparsity pattern of A, A is instead copied into a matrix with these
+        diagonals added, which is returned. This matrix is built once for each
+        pattern of A, and is overwritten by the next call.
+        """
+        if self.dofs.size == 0:
+            return A, b
+        if not (
+            np.array_equal(A.indptr, self._indptr)
+            and np.array_equal(A.indices, self._indices)
+        ):
+            self._set_pattern(A)
+
+        if self._augmented is not None:
+            self._augmented.data[:] = np.bincount(
+                self._source_positions, weights=A.data, minlength=self._augmented.nnz
+            )
+            A = self._augmented
+
+        A.data[self._row_positions] = 0
+        A.data[self._diagonal_positions] = 1
+        b[self.dofs] = values
+        return A, b
+
+    def eliminate(
+        self, A: sps.spmatrix, b: np.ndarray, values: Union[float, np.ndarray]
+    ) -> Tuple[sps.csr_matrix, np.ndarray]:
+        """System for the free dofs, with the constrained dofs moved to the rhs
+
+        Use prolong() to recover the global solution.
+        """
+        x_constrained = np.zeros(self.num_dofs)
+        x_constrained[self.dofs] = values
+        A_free = self.restriction * A * self.prolongation
+        b_free = self.restriction * (b - A * x_constrained)
+        return sps.csr_matrix(A_free), b_free
+
+    def prolong(
+        self, x_free: np.ndarray, values: Union[float, np.ndarray]
+    ) -> np.ndarray:
+        """ Global solution from the solution for the free dofs"""
+        x = self.prolongation * x_free
+        x[self.dofs] = values
+        return x
+
+    # --- Helper methods ---
+
+    def _rows(self, A: sps.csr_matrix) -> np.ndarray:
+        """ Row index of each entry of A"""
+        return np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+
+    def _set_pattern(self, A: sps.csr_matrix) -> None:
+        """Positions of the constrained rows for a new sparsity pattern
+
+        If diagonals of constrained rows are missing in the pattern of A, the
+        augmented matrix with these diagonals is built.
+        """
+        self._indptr, self._indices = A.indptr.copy(), A.indices.copy()
+        rows = self._rows(A)
+        has_diagonal = np.zeros(self.num_dofs, dtype=bool)
+        has_diagonal[rows[A.indices == rows]] = True
+        missing = self.dofs[~has_diagonal[self.dofs]]
+        if missing.size == 0:
+            self._augmented, self._source_positions = None, None
+            self._set_positions(A)
+            return
+
+        logger.info(f"Add {missing.size} diagonal entries for constrained dofs")
+        augmented = sps.coo_matrix(
+            (
+                np.ones(A.nnz + missing.size),
+                (np.append(rows, missing), np.append(A.indices, missing)),
+            ),
+            shape=A.shape,
+        ).tocsr()
+        augmented.sum_duplicates()
+
+        # Keys row * num_cols + col are increasing in the canonical augmented matrix
+        num_cols = A.shape[1]
+        augmented_keys = self._rows(augmented) * num_cols + augmented.indices
+        self._source_positions = np.searchsorted(
+            augmented_keys, rows * num_cols + A.indices
+        )
+        self._augmented = augmented
+        self._set_positions(augmented)
+
+    def _set_positions(self, A: sps.csr_matrix) -> None:
+        rows = self._rows(A)
+        is_constrained = np.zeros(self.num_dofs, dtype=bool)
+        is_constrained[self.dofs] = True
+        in_constrained_row = is_constrained[rows]
+
+        self._row_positions = np.flatnonzero(in_constrained_row)
+        diagonal = np.flatnonzero(in_constrained_row & (A.indices == rows))
+        # Only one entry per diagonal, in case of duplicate entries
+        _, first = np.unique(rows[diagonal], return_index=True)
+        self._diagonal_positions = diagonal[first]
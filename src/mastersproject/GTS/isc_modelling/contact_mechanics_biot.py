@@ -5,6 +5,7 @@ import numpy as np
 
 import porepy as pp
 from GTS.isc_modelling.flow import Flow
+from GTS.isc_modelling.linear_solver import FixedStressGMRES
 from GTS.isc_modelling.mechanics import Mechanics
 from GTS.isc_modelling.parameter import BiotParameters
 from mastersproject.util.logging_util import timer
@@ -31,7 +32,14 @@ class ContactMechanicsBiotBase(Flow, Mechanics):
             return 1
 
     def set_biot_parameters(self) -> None:
-        """ Set parameters for the simulation"""
+        """Set all parameters for the simulation
+
+        The parameters are set in three tiers:
+            static: boundary conditions and values, stiffness, friction etc.
+            time step: sources and time step size (see set_biot_time_step_parameters)
+            iterate: aperture-dependent parameters (see set_biot_iterate_parameters)
+        Use update_biot_parameters to refresh the tiers marked as stale only.
+        """
         self.set_scalar_parameters()
         self.set_mechanics_parameters()
         key_m = self.mechanics_parameter_key
@@ -51,6 +59,28 @@ class ContactMechanicsBiotBase(Flow, Mechanics):
                 [key_m, key_s],
                 [mech_params, scalar_params],
             )
+        self.stale_parameters.clear()
+
+    def set_biot_time_step_parameters(self) -> None:
+        """ Set parameters that may change between time steps, including iterates"""
+        self.set_scalar_time_step_parameters()
+        for g, d in self.gb:
+            d[pp.PARAMETERS][self.mechanics_parameter_key]["time_step"] = self.time_step
+
+    def set_biot_iterate_parameters(self) -> None:
+        """ Set parameters that depend on the aperture of the current iterate"""
+        self.set_scalar_iterate_parameters()
+
+    def update_biot_parameters(self) -> None:
+        """ Refresh the parameter tiers in self.stale_parameters"""
+        stale = self.stale_parameters
+        if "static" in stale:
+            self.set_biot_parameters()
+        elif "time_step" in stale:
+            self.set_biot_time_step_parameters()
+        elif "iterate" in stale:
+            self.set_biot_iterate_parameters()
+        stale.clear()
 
     # --- Primary variables and discretizations ---
 
@@ -238,10 +268,73 @@ class ContactMechanicsBiotBase(Flow, Mechanics):
         self.assign_biot_discretizations()
         self.initial_biot_condition()
         self.discretize()
+        self.bind_state_buffers()
         self.initialize_linear_solver()
 
         self.set_viz()
 
+    @timer(logger, level="INFO")
+    def initialize_linear_solver(self) -> None:
+        """Initialize linear solver
+
+        In addition to the direct solver, we allow
+            "gmres_fixed_stress": GMRES preconditioned by a fixed-stress split,
+                see FixedStressGMRES.
+        The "amg" solver of the flow model is not suited for the saddle point
+        structure of the coupled system, and is not allowed.
+        """
+        if self.params.linear_solver == "amg":
+            raise ValueError("The amg solver is only supported for flow models")
+        elif self.params.linear_solver == "gmres_fixed_stress":
+            if self.params.condense_contact_traction:
+                raise ValueError(
+                    "Static condensation is not supported with gmres_fixed_stress"
+                )
+            self.linear_solver = FixedStressGMRES()
+            self.linear_solver.set_block_structure(*self.fixed_stress_blocks())
+        else:
+            super().initialize_linear_solver()
+
+    def fixed_stress_blocks(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Flow and mechanics dofs, and the fixed-stress stabilization
+
+        The flow block consists of the pressure and mortar flux variables,
+        the mechanics block of the displacement, mortar displacement and contact
+        traction variables. The stabilization alpha^2 / K_dr * cell volume is
+        added to the pressure dofs of the Nd-grid, where the Biot coupling is.
+
+        Returns
+        -------
+        flow_dofs, mechanics_dofs : np.ndarray
+            global dof indices of the flow and mechanics blocks
+        stabilization : np.ndarray
+            fixed-stress stabilization on the flow dofs
+        """
+        flow_variables = [self.scalar_variable, self.mortar_scalar_variable]
+        bulk_modulus = self.params.rock.BULK_MODULUS * (
+            pp.PASCAL / self.params.scalar_scale
+        )
+        flow_dofs, mechanics_dofs, stabilization = [], [], []
+        layout = self.dof_layout
+        for g, var in layout.block_keys:
+            dofs = layout.block_dofs((g, var))
+            if var not in flow_variables:
+                mechanics_dofs.append(dofs)
+                continue
+
+            flow_dofs.append(dofs)
+            if var == self.scalar_variable and g.dim == self.Nd:
+                alpha = self.biot_alpha(g)
+                stabilization.append(alpha ** 2 / bulk_modulus * g.cell_volumes)
+            else:
+                stabilization.append(np.zeros(dofs.size))
+
+        return (
+            np.hstack(flow_dofs).astype(int),
+            np.hstack(mechanics_dofs).astype(int),
+            np.hstack(stabilization),
+        )
+
     def check_convergence(
         self,
         solution: np.ndarray,
@@ -278,14 +371,9 @@ class ContactMechanicsBiotBase(Flow, Mechanics):
            Discretize time-dependent quantities etc.
            Update time-dependent parameters (captured by assembly).
         """
-        self.set_biot_parameters()
-
-    def before_newton_iteration(self) -> None:
-        # Re-discretize the nonlinear term
-        term_filter = pp.assembler_filters.ListFilter(
-            term_list=[self.friction_coupling_term]
-        )
-        self.assembler.discretize(term_filter)
+        self.stale_parameters.add("time_step")
+        self.update_biot_parameters()
+        self._friction_discretization = {}
 
     def after_newton_convergence(self, solution, errors, iteration_counter) -> None:
         super().after_newton_convergence(solution, errors, iteration_counter)
@@ -0,0 +1,191 @@
+""" Parallel discretization of the terms of a grid bucket"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sps
+
+import porepy as pp
+
+logger = logging.getLogger(__name__)
+
+# A task is a list of discretize calls, done in order by one thread
+Task = List[Callable[[], None]]
+
+
+class DiscretizationScheduler:
+    """Discretize independent grids and interfaces in a thread pool
+
+    The terms of different grids are independent, and so are the coupling terms of
+    interfaces with different secondary grids. The terms of one grid, and the coupling
+    terms of all interfaces of one secondary grid, are discretized in one task. All
+    grid terms are discretized before the coupling terms, which may depend on them.
+    Large grids are scheduled first.
+
+    The discretizations write their matrices to the data dictionaries of the grid
+    bucket, which are shared by the threads. Thus no merging is needed. Interfaces
+    of different secondary grids may share the primary grid, so the coupling
+    discretizations must not write to the data of the primary grid. This is checked
+    for the discretization matrices, and a RuntimeError is raised if violated.
+
+    Parallelism is opt-in. Much of the MPFA and Biot discretization in porepy is
+    Python code which holds the GIL, so the speedup depends on the model. Time the
+    re-discretization before using more than one thread.
+
+    Parameters
+    ----------
+    max_workers : int
+        number of threads. The tasks are run serially if 1.
+    """
+
+    def __init__(self, max_workers: int = 1):
+        self.max_workers = max_workers
+
+    def discretize(
+        self,
+        gb: pp.GridBucket,
+        filt: Optional[pp.assembler_filters.AssemblerFilter] = None,
+    ) -> None:
+        """ Discretize the terms passing the filter, see pp.Assembler.discretize"""
+        if filt is None:
+            filt = pp.assembler_filters.AllPassFilter()
+        node_tasks = self.node_tasks(gb, filt)
+        coupling_tasks = self.coupling_tasks(gb, filt)
+        logger.info(
+            f"Discretize {len(node_tasks)} grids and {len(coupling_tasks)} interface "
+            f"groups using {self.max_workers} threads"
+        )
+        self._run(node_tasks)
+        parallel = self.max_workers > 1
+        primary_matrices = self.primary_matrices(gb) if parallel else None
+        self._run(coupling_tasks)
+        if parallel and not _same_objects(primary_matrices, self.primary_matrices(gb)):
+            raise RuntimeError(
+                "A coupling discretization wrote to the data of a primary grid. "
+                "Discretize with one thread."
+            )
+
+    @staticmethod
+    def node_tasks(
+        gb: pp.GridBucket, filt: pp.assembler_filters.AssemblerFilter
+    ) -> List[Task]:
+        """ One task per grid, ordered by decreasing number of cells"""
+        tasks: Dict[pp.Grid, Task] = {}
+        for g, d in gb:
+            for var, terms in d.get(pp.DISCRETIZATION, {}).items():
+                for term, discr in terms.items():
+                    if filt.filter(grids=[g], variables=[var], terms=[term]):
+                        tasks.setdefault(g, []).append(partial(discr.discretize, g, d))
+        grids = sorted(tasks, key=lambda g: g.num_cells, reverse=True)
+        return [tasks[g] for g in grids]
+
+    @staticmethod
+    def coupling_tasks(
+        gb: pp.GridBucket, filt: pp.assembler_filters.AssemblerFilter
+    ) -> List[Task]:
+        """ One task per secondary grid, for the coupling terms of its interfaces"""
+        tasks: Dict[pp.Grid, Task] = {}
+        for e, d in gb.edges():
+            g_l, g_h = gb.nodes_of_edge(e)
+            d_l, d_h = gb.node_props(g_l), gb.node_props(g_h)
+            for term, coupling in d.get(pp.COUPLING_DISCRETIZATION, {}).items():
+                var_e, discr = coupling[e]
+                if discr is None or not filt.filter(
+                    grids=[(g_h, g_l, e)], variables=[var_e], terms=[term]
+                ):
+                    continue
+                tasks.setdefault(g_l, []).append(
+                    partial(discr.discretize, g_h, g_l, d_h, d_l, d)
+                )
+        grids = sorted(tasks, key=lambda g: g.num_cells, reverse=True)
+        return [tasks[g] for g in grids]
+
+    @staticmethod
+    def primary_matrices(gb: pp.GridBucket) -> Dict[Tuple, sps.spmatrix]:
+        """ Discretization matrices stored in the data of the primary grids"""
+        matrices = {}
+        for e, _ in gb.edges():
+            _, g_h = gb.nodes_of_edge(e)
+            stored = gb.node_props(g_h).get(pp.DISCRETIZATION_MATRICES, {})
+            for keyword, keyword_matrices in stored.items():
+                for key, matrix in keyword_matrices.items():
+                    matrices[(g_h, keyword, key)] = matrix
+        return matrices
+
+    def _run(self, tasks: List[Task]) -> None:
+        """ Run the tasks, and re-raise the first exception"""
+        if self.max_workers <= 1:
+            for task in tasks:
+                _run_task(task)
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(_run_task, task) for task in tasks]
+            for future in futures:
+                future.result()
+
+
+def _run_task(task: Task) -> None:
+    for discretize in task:
+        discretize()
+
+
+def _same_objects(a: Dict, b: Dict) -> bool:
+    """ Whether two dictionaries have the same keys, and identical values"""
+    return a.keys() == b.keys() and all(a[key] is b[key] for key in a)
+
+
+def affected_faces(g: pp.Grid, cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Nodes of the cells, and the faces that share a node with the cells
+
+    The MPFA stencils of these faces depend on the parameters of the cells.
+    """
+    nodes = np.unique(g.cell_nodes().tocsc()[:, cells].indices)
+    faces = np.unique(g.face_nodes.tocsr()[nodes].indices)
+    return nodes, faces
+
+
+def partial_update(discr: pp.Mpfa, g: pp.Grid, data: Dict, cells: np.ndarray) -> None:
+    """Update an MPFA discretization after a change of the parameters in some cells
+
+    The local stencils of the faces that share a node with the cells are
+    re-discretized, using the specified_nodes parameter of pp.Mpfa. The rows of
+    these faces are then replaced in the stored matrices. If a stored matrix does
+    not have one row per face, all cells are discretized instead.
+
+    Parameters
+    ----------
+    discr : pp.Mpfa
+        discretization of the grid, already discretized with the old parameters
+    g : pp.Grid
+        grid
+    data : Dict
+        data dictionary of the grid
+    cells : np.ndarray
+        cells with changed parameters
+    """
+    parameters = data[pp.PARAMETERS][discr.keyword]
+    matrices = data[pp.DISCRETIZATION_MATRICES][discr.keyword]
+    old_matrices = dict(matrices)
+
+    nodes, faces = affected_faces(g, cells)
+    parameters["specified_nodes"] = nodes
+    try:
+        discr.discretize(g, data)
+    finally:
+        del parameters["specified_nodes"]
+
+    for key, new in matrices.items():
+        old = old_matrices.get(key)
+        if old is None or old.shape != new.shape or new.shape[0] != g.num_faces:
+            logger.warning(f"Cannot patch the matrix {key}. Discretize all cells.")
+            discr.discretize(g, data)
+            return
+
+    update = np.zeros(g.num_faces)
+    update[faces] = 1
+    keep, replace = sps.diags(1 - update), sps.diags(update)
+    for key, new in matrices.items():
+        matrices[key] = (keep * old_matrices[key] + replace * new).tocsr()
+    logger.debug(f"Updated {faces.size} of {g.num_faces} faces in a {g.dim}d grid")
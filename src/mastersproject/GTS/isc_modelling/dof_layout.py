@@ -0,0 +1,84 @@
+""" Index of the degrees of freedom of the variables in the global system"""
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+import porepy as pp
+
+logger = logging.getLogger(__name__)
+
+# A block is a (grid or edge, variable) pair, see pp.Assembler.block_dof
+BlockKey = Tuple[Union[pp.Grid, Tuple[pp.Grid, pp.Grid]], str]
+
+
+class DofLayout:
+    """Precomputed dof indices of the variables in the global system
+
+    The layout is built once from an assembler. The dofs of each block are
+    contiguous, and the blocks are ordered as in the global system. Index arrays
+    of a variable, optionally restricted to grids or interfaces of one dimension,
+    are computed on first use and stored.
+    """
+
+    def __init__(self, assembler: pp.Assembler):
+        self.assembler = assembler
+        self.num_dofs: int = assembler.num_dof()
+
+        offsets = np.cumsum(np.append(0, np.asarray(assembler.full_dof, dtype=int)))
+        block_dof: Dict[BlockKey, int] = assembler.block_dof
+
+        # Blocks in the order of the global system
+        self.block_keys: List[BlockKey] = sorted(block_dof, key=block_dof.get)
+        self.slices: Dict[BlockKey, slice] = {
+            key: slice(offsets[bi], offsets[bi + 1]) for key, bi in block_dof.items()
+        }
+
+        self._blocks: Dict[Tuple[str, Optional[int]], List] = {}
+        self._dofs: Dict[Tuple[str, Optional[int]], np.ndarray] = {}
+
+    def block_dofs(self, key: BlockKey) -> np.ndarray:
+        """ Global dofs of a (grid or edge, variable) block"""
+        s = self.slices[key]
+        return np.arange(s.start, s.stop)
+
+    def blocks(
+        self, variable: str, dim: Optional[int] = None
+    ) -> List[Tuple[Union[pp.Grid, Tuple[pp.Grid, pp.Grid]], slice]]:
+        """Grids or edges of a variable, with the slice of their global dofs
+
+        Parameters
+        ----------
+        variable : str
+            variable name
+        dim : int, Optional
+            if given, only grids of this dimension, or edges with mortar grids of
+            this dimension.
+        """
+        key = (variable, dim)
+        if key not in self._blocks:
+            self._blocks[key] = [
+                (g, self.slices[(g, var)])
+                for g, var in self.block_keys
+                if var == variable and (dim is None or _dim(g) == dim)
+            ]
+        return self._blocks[key]
+
+    def dofs(self, variable: str, dim: Optional[int] = None) -> np.ndarray:
+        """Global dofs of a variable, see blocks()
+
+        The returned index array is shared, and should not be modified.
+        """
+        key = (variable, dim)
+        if key not in self._dofs:
+            dofs = [np.arange(s.start, s.stop) for _, s in self.blocks(variable, dim)]
+            self._dofs[key] = np.concatenate(dofs) if dofs else np.zeros(0, dtype=int)
+            self._dofs[key].setflags(write=False)
+        return self._dofs[key]
+
+
+def _dim(g: Union[pp.Grid, Tuple[pp.Grid, pp.Grid]]) -> int:
+    """ Dimension of a grid, or of the mortar grid of an edge"""
+    if isinstance(g, tuple):
+        return min(g[0].dim, g[1].dim)
+    return g.dim
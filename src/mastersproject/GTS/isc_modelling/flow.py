@@ -1,12 +1,14 @@
 import logging
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set
 
 import numpy as np
 
 import porepy as pp
 from GTS.isc_modelling.general_model import CommonAbstractModel
 from GTS.isc_modelling.ISCGrid import create_grid
+from GTS.isc_modelling.linear_solver import AMGSolver
+from GTS.isc_modelling.mortar_projections import mortar_projection
 from GTS.isc_modelling.parameter import BaseParameters, FlowParameters
 from porepy.params.data import add_nonpresent_dictionary
 from porepy.utils.derived_discretizations import implicit_euler
@@ -39,6 +41,11 @@ class Flow(CommonAbstractModel):
         self.scalar_coupling_term = "robin_" + self.scalar_variable
         self.scalar_parameter_key = "flow"
 
+        # Parameter tiers to be refreshed by update_scalar_parameters (or
+        # update_biot_parameters in coupled models).
+        # Either of "static", "time_step" and "iterate".
+        self.stale_parameters: Set[str] = {"static"}
+
     # --- Grid methods ---
 
     def create_grid(self):
@@ -81,13 +88,23 @@ class Flow(CommonAbstractModel):
         injection_rate = self.params.injection_protocol.active_rate(
             self.time
         )  # injection rate [l / s], unscaled
+        return self.scale_injection_rate(injection_rate)
+
+    def scale_injection_rate(self, injection_rate: float) -> float:
+        """ Scale an injection rate [l / s] to a source flow rate"""
         return (
                 injection_rate * pp.MILLI * (pp.METER / self.params.length_scale) ** self.Nd
         )
 
-    def source_scalar(self, g: pp.Grid) -> np.ndarray:
-        """ Well-bore source (scaled)"""
-        flow_rate = self.source_flow_rate  # scaled
+    def source_scalar(
+        self, g: pp.Grid, flow_rate: Optional[float] = None
+    ) -> np.ndarray:
+        """Well-bore source (scaled)
+
+        flow_rate is the scaled source flow rate. Default is self.source_flow_rate.
+        """
+        if flow_rate is None:
+            flow_rate = self.source_flow_rate  # scaled
         values = flow_rate * g.tags["well_cells"] * self.time_step
         return values
 
@@ -123,7 +140,32 @@ class Flow(CommonAbstractModel):
         For 3d-matrix: unitary (aperture isn't really defined in 3d)
         For 2d-fracture: fetch from the parameter dictionary
         For 1d-intersection: Get the max from the two adjacent fractures
+
+        The (unscaled) initial aperture is computed once per grid, and stored in
+        the node data. See also set_initial_aperture.
         """
+        d = self.gb.node_props(g)
+        if "initial_aperture" not in d:
+            aperture = self._initial_aperture(g)
+            aperture.setflags(write=False)
+            d["initial_aperture"] = aperture
+
+        scale = pp.METER / self.params.length_scale if scaled else 1
+        return d["initial_aperture"] * scale
+
+    def set_initial_aperture(self) -> None:
+        """Compute the initial aperture of all grids, and store it in the node data
+
+        Grids are visited in order of decreasing dimension, such that intersections
+        reuse the initial apertures of the adjacent fractures.
+        """
+        for dim in range(self.Nd, self.Nd - 3, -1):
+            for g in self.gb.grids_of_dimension(dim):
+                self.gb.node_props(g).pop("initial_aperture", None)
+                self.compute_initial_aperture(g, scaled=False)
+
+    def _initial_aperture(self, g: pp.Grid) -> np.ndarray:
+        """ Compute the unscaled initial aperture. See compute_initial_aperture"""
         aperture = np.ones(g.num_cells)
         nd = self.Nd
         gb = self.gb
@@ -139,30 +181,21 @@ class Flow(CommonAbstractModel):
             # i.e. fractures. Then take the cell-by-cell mean.
             primary_grids = gb.node_neighbors(g, only_higher=True)
             primary_aps = [
-                self.compute_initial_aperture(g, scaled=scaled) for g in primary_grids
-            ]
-            primary_edges = [(g, g_h) for g_h in primary_grids]
-            primary_cell_faces = [g_h.cell_faces for g_h in primary_grids]
-            mortar_grids = [
-                gb.edge_props(edge)["mortar_grid"] for edge in primary_edges
+                self.compute_initial_aperture(g_h, scaled=False)
+                for g_h in primary_grids
             ]
             projected_aps = [
-                mg.mortar_to_secondary_int()
-                * mg.primary_to_mortar_int()
-                * np.abs(cell_face)
-                * ap
-                for mg, ap, cell_face in zip(
-                    mortar_grids, primary_aps, primary_cell_faces
+                mortar_projection(
+                    gb.edge_props((g, g_h)), "primary_cell_to_secondary_cell", g_h
                 )
+                * ap
+                for g_h, ap in zip(primary_grids, primary_aps)
             ]
             apertures = np.vstack(projected_aps)
             aperture *= np.mean(apertures, axis=0)
         else:
             raise ValueError("Not implemented 0d intersection points")
 
-        if scaled:
-            aperture *= pp.METER / self.params.length_scale
-
         return aperture
 
     def specific_volume(self, g: pp.Grid, scaled: bool) -> np.ndarray:
@@ -187,44 +220,80 @@ class Flow(CommonAbstractModel):
             * time_step (needed for some discretization methods)
             * permeability (see self.set_permeability_from_aperture)
             * gravity source term (see self.vector_source)
-        """
-        gb = self.gb
 
-        # Set to 0 for steady state
-        compressibility: float = self.params.fluid.COMPRESSIBILITY * (
-            self.params.scalar_scale / pp.PASCAL
-        )  # scaled. [1/Pa]
-        for g, d in gb:
-            porosity: np.ndarray = self.porosity(g)  # Unit [-]
-            # specific volume
-            specific_volume: np.ndarray = self.specific_volume(g, scaled=True)
-
-            # Boundary and source conditions
+        The boundary conditions are set here only. Parameters that change between
+        time steps or Newton iterations are set by
+        set_scalar_time_step_parameters and set_scalar_iterate_parameters.
+        Use update_scalar_parameters to refresh the tiers marked as stale only.
+        """
+        for g, d in self.gb:
+            # Boundary conditions
             bc: pp.BoundaryCondition = self.bc_type_scalar(g)
             bc_values: np.ndarray = self.bc_values_scalar(g)  # Already scaled
-            source_values: np.ndarray = self.source_scalar(g)  # Already scaled
-
-            # Mass weight
-            mass_weight = compressibility * porosity * specific_volume
 
             # Initialize data
             pp.initialize_data(
                 g,
                 d,
                 self.scalar_parameter_key,
-                {
-                    "bc": bc,
-                    "bc_values": bc_values,
-                    "mass_weight": mass_weight,
-                    "source": source_values,
-                    "time_step": self.time_step,
-                },
+                {"bc": bc, "bc_values": bc_values},
+            )
+
+        self.set_scalar_time_step_parameters()
+        self.stale_parameters.clear()
+
+    def update_scalar_parameters(self) -> None:
+        """ Refresh the scalar parameter tiers in self.stale_parameters"""
+        stale = self.stale_parameters
+        if "static" in stale:
+            self.set_scalar_parameters()
+        elif "time_step" in stale:
+            self.set_scalar_time_step_parameters()
+        elif "iterate" in stale:
+            self.set_scalar_iterate_parameters()
+        stale.clear()
+
+    def set_scalar_time_step_parameters(self) -> None:
+        """Set scalar parameters that may change between time steps
+
+        We set source, time_step and gravity in the subdomains (the density
+        depends on the pressure), and then the parameters of each iterate.
+        """
+        for g, d in self.gb:
+            source_values: np.ndarray = self.source_scalar(g)  # Already scaled
+            d[pp.PARAMETERS][self.scalar_parameter_key].update(
+                {"source": source_values, "time_step": self.time_step}
             )
 
-        # Set permeability on grid, fracture and mortar grids.
-        self.set_permeability_from_aperture()
         # Set gravitational effects
         self.vector_source()
+        self.set_scalar_iterate_parameters()
+
+    def set_scalar_iterate_parameters(self) -> None:
+        """Set scalar parameters that depend on the aperture
+
+        We set mass_weight, permeability and gravity on the interfaces.
+        """
+        for g, d in self.gb:
+            d[pp.PARAMETERS][self.scalar_parameter_key][
+                "mass_weight"
+            ] = self.mass_weight(g)
+
+        # Set permeability on grid, fracture and mortar grids.
+        self.set_permeability_from_aperture()
+        # Set gravitational effects on the interfaces
+        self.interface_vector_source()
+
+    def mass_weight(self, g: pp.Grid) -> np.ndarray:
+        """ Mass weight (aka storage / compressibility term), scaled"""
+        # Set to 0 for steady state
+        compressibility: float = self.params.fluid.COMPRESSIBILITY * (
+            self.params.scalar_scale / pp.PASCAL
+        )  # scaled. [1/Pa]
+        porosity: np.ndarray = self.porosity(g)  # Unit [-]
+        # specific volume
+        specific_volume: np.ndarray = self.specific_volume(g, scaled=True)
+        return compressibility * porosity * specific_volume
 
     def permeability(self, g, scaled, **kwargs) -> np.ndarray:
         """ Set (uniform) permeability in a subdomain"""
@@ -263,7 +332,7 @@ class Flow(CommonAbstractModel):
             k: np.ndarray = self.permeability(g, scaled=True)  # permeability [m2] (scaled)
 
             # Multiply by the volume of the flattened dimension (specific volume)
-            k *= self.specific_volume(g, scaled=True)
+            k = k * self.specific_volume(g, scaled=True)
 
             kxx = k / viscosity
             diffusivity = pp.SecondOrderTensor(kxx)
@@ -309,7 +378,7 @@ class Flow(CommonAbstractModel):
     # --- Gravity-related methods ---
 
     def vector_source(self):
-        """ Set gravity as a vector source term in the fluid flow equations"""
+        """ Set gravity as a vector source term in the subdomain flow equations"""
         if not self.params.gravity:
             return
 
@@ -327,6 +396,18 @@ class Flow(CommonAbstractModel):
             }
             pp.initialize_data(g, d, scalar_key, vector_params)
 
+    def interface_vector_source(self):
+        """Set gravity as a vector source term on the interfaces
+
+        The interface gravity depends on the aperture of the lower-dimensional
+        neighbour.
+        """
+        if not self.params.gravity:
+            return
+
+        gb = self.gb
+        scalar_key = self.scalar_parameter_key
+        ls, ss = self.params.length_scale, self.params.scalar_scale
         for e, de in gb.edges():
             mg: pp.MortarGrid = de["mortar_grid"]
             g_l, _ = gb.nodes_of_edge(e)
@@ -495,6 +576,10 @@ class Flow(CommonAbstractModel):
 
         self.assembler.discretize()
 
+        # The AMG hierarchy is built once per discretization
+        if isinstance(self.linear_solver, AMGSolver):
+            self.linear_solver.reset()
+
     # --- Initial condition ---
 
     def initial_scalar_condition(self) -> None:
@@ -530,6 +615,7 @@ class Flow(CommonAbstractModel):
         self.assign_scalar_discretizations()
         self.initial_scalar_condition()
         self.discretize()
+        self.bind_state_buffers()
         self.initialize_linear_solver()
 
         self.set_viz()
@@ -538,6 +624,19 @@ class Flow(CommonAbstractModel):
         """ Wrapper to create grid"""
         self.create_grid()
 
+    @timer(logger, level="INFO")
+    def initialize_linear_solver(self) -> None:
+        """Initialize linear solver
+
+        In addition to the direct solver, we allow
+            "amg": GMRES preconditioned by smoothed aggregation AMG,
+                see AMGSolver.
+        """
+        if self.params.linear_solver == "amg":
+            self.linear_solver = AMGSolver()
+        else:
+            super().initialize_linear_solver()
+
     def check_convergence(
         self,
         solution: np.ndarray,
@@ -564,9 +663,7 @@ class Flow(CommonAbstractModel):
         diverged = False
 
         # Find indices for pressure variables
-        scalar_dof = np.array([], dtype=np.int)
-        for g, _ in self.gb:
-            scalar_dof = np.hstack((scalar_dof, self.assembler.dof_ind(g, var_s)))
+        scalar_dof = self.dof_layout.dofs(var_s)
 
         # Unscaled pressure solutions
         scalar_now = solution[scalar_dof] * ss
@@ -610,35 +707,6 @@ class Flow(CommonAbstractModel):
 
         return error_scalar, converged, diverged
 
-    @timer(logger, level="INFO")
-    def initialize_linear_solver(self):
-        """Initialize linear solver
-
-        Currently, we only consider the direct solver.
-        See also self.assemble_and_solve_linear_system()
-        """
-
-        # # Compute exact condition number:
-        # A, _ = self.assembler.assemble_matrix_rhs()
-        # cond = spla.norm(A, 1) * spla.norm(spla.inv(A), 1)
-        # logger.info(f"Exact condition number: {cond:.2e}")
-
-        if self.params.linear_solver == "direct":
-            """In theory, it should be possible to instruct SuperLU to reuse the
-            symbolic factorization from one iteration to the next. However, it seems
-            the scipy wrapper around SuperLU has not implemented the necessary
-            functionality, as discussed in
-
-                https://github.com/scipy/scipy/issues/8227
-
-            We will therefore pass here, and pay the price of long computation times.
-
-            """
-            pass
-
-        else:
-            raise ValueError(f"Unknown linear solver {self.params.linear_solver}")
-
     # --- Newton iterations ---
 
     def before_newton_loop(self):
@@ -646,14 +714,50 @@ class Flow(CommonAbstractModel):
         E.g.
            Discretize time-dependent quantities etc.
            Update time-dependent parameters (captured by assembly).
+        The static parameters are set once, in prepare_simulation.
         """
-        self.set_scalar_parameters()
+        self.stale_parameters.add("time_step")
+        self.update_scalar_parameters()
 
     def after_simulation(self):
         """Called after a time-dependent problem"""
         self.export_pvd()
         logger.info(f"Solution exported to folder \n {self.params.folder_name}")
 
+    def injection_rate_rhs(self, injection_rates: List[float]) -> np.ndarray:
+        """Right-hand sides of the current time step for several injection rates
+
+        Only the well-bore source depends on the injection rate, and it enters the
+        right-hand side of the pressure equation linearly. We therefore assemble
+        the system once, at the current injection rate, and shift the source at
+        the pressure dofs of each grid.
+
+        Use with solve_many() to solve for all rates with one factorization.
+
+        Parameters
+        ----------
+        injection_rates : List[float]
+            injection rates [l / s], unscaled
+
+        Returns
+        -------
+        np.ndarray
+            right-hand sides, one per column
+        """
+        _, b = self.assemble_matrix_rhs()
+
+        # Source of unit (scaled) flow rate
+        layout = self.dof_layout
+        unit_source = np.zeros(b.size)
+        for g, _ in self.gb:
+            dofs = layout.slices[(g, self.scalar_variable)]
+            unit_source[dofs] = self.source_scalar(g, flow_rate=1)
+
+        flow_rates = np.array([self.scale_injection_rate(r) for r in injection_rates])
+        return b[:, np.newaxis] + np.outer(
+            unit_source, flow_rates - self.source_flow_rate
+        )
+
     # --- Exporting and visualization ---
 
     def set_viz(self):
@@ -834,6 +938,7 @@ class FlowISC(Flow):
         if self.gb is None:
             super()._prepare_grid()
         self.well_cells()  # tag well cells
+        self.set_initial_aperture()
 
     # -- For testing --
 
@@ -878,12 +983,13 @@ class FlowISC(Flow):
         self.neg_ind = neg_ind  # noqa
         self.negneg_ind = negneg_ind  # noqa
 
-        # Condition number
+        # Condition number, and the max/min ratios of the row sums and diagonal
         A, _ = self.assembler.assemble_matrix_rhs()  # noqa
         row_sum = np.sum(np.abs(A), axis=1)
-        pp_cond = np.max(row_sum) / np.min(row_sum)
+        row_sum_ratio = np.max(row_sum) / np.min(row_sum)
         diag = np.abs(A.diagonal())
-        umfpack_cond = np.max(diag) / np.min(diag)
+        diag_ratio = np.max(diag) / np.min(diag)
+        cond_1 = self.estimate_condition_number()
 
         summary_param = (
             f"\nSummary of relevant parameters:\n"
@@ -891,8 +997,9 @@ class FlowISC(Flow):
             f"scalar scale: {self.params.scalar_scale:.2e}\n"
             f"time step: {self.time_step / pp.HOUR:.4f} hours\n"
             f"3d cells: {g.num_cells}\n"
-            f"pp condition number: {pp_cond:.2e}\n"
-            f"umfpack condition number: {umfpack_cond:.2e}\n"
+            f"row sum ratio (max/min): {row_sum_ratio:.2e}\n"
+            f"diagonal ratio (max/min): {diag_ratio:.2e}\n"
+            f"condition number (1-norm estimate): {cond_1:.2e}\n"
         )
 
         scalar_parameters = d[pp.PARAMETERS][self.scalar_parameter_key]
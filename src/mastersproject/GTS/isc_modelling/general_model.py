@@ -1,15 +1,27 @@
 import abc
 import logging
 import time
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
+import scipy.sparse as sps
+from pypardiso.pardiso_wrapper import PyPardisoError
 
 import porepy as pp
+from GTS.isc_modelling.assembly import IncrementalAssembler
+from GTS.isc_modelling.constraints import DofConstraint
+from GTS.isc_modelling.discretization import DiscretizationScheduler
+from GTS.isc_modelling.dof_layout import DofLayout
+from GTS.isc_modelling.linear_solver import (
+    AMGSolver,
+    FixedStressGMRES,
+    PardisoSolver,
+    StaticCondensation,
+    condition_number_estimate,
+)
 from GTS.isc_modelling.parameter import BaseParameters
 from mastersproject.util.logging_util import timer
 from porepy.models.abstract_model import AbstractModel
-from pypardiso import spsolve
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +34,27 @@ class CommonAbstractModel(AbstractModel):
         self.gb: Optional[pp.GridBucket] = None
         self.bounding_box: Optional[Dict[str, int]] = None
         self.assembler: Optional[pp.Assembler] = None
+        self._dof_layout: Optional[DofLayout] = None
+        # Dirichlet-type constraints by name, see dof_constraint
+        self._dof_constraints: Dict[str, DofConstraint] = {}
+        # Parallel re-discretization, if enabled
+        self.discretization_scheduler: Optional[DiscretizationScheduler] = None
+        # Assembly of the static terms once per time step, if enabled
+        self.incremental_assembly: Optional[IncrementalAssembler] = None
+
+        # Linear solver
+        self.linear_solver: Optional[
+            Union[PardisoSolver, FixedStressGMRES, AMGSolver]
+        ] = None
+        self.static_condensation: Optional[StaticCondensation] = None
+        # System assembled by nonlinear_residual_norm at the current iterate. Used by
+        # the next call to assemble_and_solve_linear_system, and discarded when the
+        # iterate or the discretization changes.
+        self._assembled_system: Optional[Tuple[sps.spmatrix, np.ndarray]] = None
+
+        # Contiguous state and iterate of all variables, see bind_state_buffers
+        self._state_buffer: Optional[np.ndarray] = None
+        self._iterate_buffer: Optional[np.ndarray] = None
 
         # Viz
         self.viz: Optional[pp.Exporter] = None
@@ -33,21 +66,92 @@ class CommonAbstractModel(AbstractModel):
 
         Returns:
             np.array: The current state, as stored in the GridBucket.
+                If the state is backed by a buffer (see bind_state_buffers), this
+                is a copy of the buffer.
 
         """
-        size = self.assembler.num_dof()
-        state = np.zeros(size)
-        for g, var in self.assembler.block_dof.keys():
-            # Index of
-            ind = self.assembler.dof_ind(g, var)
+        if self._state_buffer is not None:
+            self._ensure_state_buffers()
+            return self._state_buffer.copy()
 
+        # The blocks are contiguous, and ordered as in the assembler.
+        values = []
+        for g, var in self.dof_layout.block_keys:
             if isinstance(g, tuple):
-                values = self.gb.edge_props(g)[pp.STATE][var]
+                values.append(self.gb.edge_props(g)[pp.STATE][var])
             else:
-                values = self.gb.node_props(g)[pp.STATE][var]
-            state[ind] = values
+                values.append(self.gb.node_props(g)[pp.STATE][var])
 
-        return state
+        return np.concatenate(values) if values else np.zeros(0)
+
+    def bind_state_buffers(self) -> None:
+        """Back the variables in pp.STATE and pp.ITERATE by contiguous buffers
+
+        The state and iterate of all variables are copied to two global vectors,
+        ordered as in the assembler. The entries in the grid bucket data are then
+        replaced by views into these vectors, such that gathering and distributing
+        the state are single copies.
+
+        Call after the assembler is created and the initial conditions are set.
+        Thereafter, the variables in pp.STATE and pp.ITERATE should be updated in
+        place, e.g. by update_state and after_newton_convergence. If an entry is
+        reassigned, e.g. by setting the initial conditions again, the buffers are
+        rebound on the next use, see _ensure_state_buffers.
+        """
+        layout = self.dof_layout
+        self._state_buffer = np.zeros(layout.num_dofs)
+        self._iterate_buffer = np.zeros(layout.num_dofs)
+
+        for g, var in layout.block_keys:
+            dofs = layout.slices[(g, var)]
+            d = self.gb.edge_props(g) if isinstance(g, tuple) else self.gb.node_props(g)
+            state: Dict = d[pp.STATE]
+            iterate: Dict = state.setdefault(pp.ITERATE, {})
+
+            self._state_buffer[dofs] = state[var]
+            self._iterate_buffer[dofs] = iterate.get(var, state[var])
+            state[var] = self._state_buffer[dofs]
+            iterate[var] = self._iterate_buffer[dofs]
+
+    def _ensure_state_buffers(self) -> None:
+        """ Rebind the state buffers if an entry in the grid bucket was reassigned"""
+        for g, var in self.dof_layout.block_keys:
+            d = self.gb.edge_props(g) if isinstance(g, tuple) else self.gb.node_props(g)
+            state: Dict = d[pp.STATE]
+            iterate = state.get(pp.ITERATE, {}).get(var)
+            if (
+                state[var].base is not self._state_buffer
+                or getattr(iterate, "base", None) is not self._iterate_buffer
+            ):
+                logger.info(f"{var} was reassigned. Rebind the state buffers.")
+                self.bind_state_buffers()
+                return
+
+    @property
+    def dof_layout(self) -> DofLayout:
+        """ Dof indices of the variables, built once for each assembler"""
+        if self._dof_layout is None or self._dof_layout.assembler is not self.assembler:
+            self._dof_layout = DofLayout(self.assembler)
+            self._dof_constraints = {}
+        return self._dof_layout
+
+    def dof_constraint(
+        self, name: str, dofs: Callable[[], np.ndarray]
+    ) -> DofConstraint:
+        """Fetch a constraint on a set of dofs, built once for each dof layout
+
+        Parameters
+        ----------
+        name : str
+            name of the constraint
+        dofs : Callable
+            returns the global indices of the constrained dofs. Called only when
+            the constraint is built.
+        """
+        layout = self.dof_layout
+        if name not in self._dof_constraints:
+            self._dof_constraints[name] = DofConstraint(dofs(), layout.num_dofs)
+        return self._dof_constraints[name]
 
     @abc.abstractmethod
     def prepare_simulation(self):
@@ -76,29 +180,47 @@ class CommonAbstractModel(AbstractModel):
         """Method to be called at the start of every non-linear iteration.
 
         Possible usage is to update non-linear parameters, discertizations etc.
+        Overrides must call this method, as it discards the system assembled by
+        nonlinear_residual_norm().
 
         """
-        pass
+        self._assembled_system = None
+
+    def contact_state(self) -> np.ndarray:
+        """Classification of the fracture cells in the current iterate
+
+        Models with contact mechanics return 0 for open, 1 for sticking and
+        2 for sliding cells. The default is no fracture cells.
+        """
+        return np.zeros(0, dtype=int)
 
     def after_newton_iteration(self, solution_vector: np.ndarray) -> None:
         """Actions after each Newton iteration
 
         For instance; update_state updates the non-linear terms.
+        The system assembled by nonlinear_residual_norm() is discarded.
 
         Parameters:
             solution_vector : np.ndarray
                 solution vector for the current iterate.
 
         """
+        self._assembled_system = None
         self.update_state(solution_vector)
 
     def update_state(self, solution_vector: np.ndarray) -> None:
         """ Update variables for the current Newton iteration"""
-        pass
+        if self._iterate_buffer is not None:
+            self._ensure_state_buffers()
+            np.copyto(self._iterate_buffer, solution_vector)
 
     def after_newton_convergence(self, solution, errors, iteration_counter) -> None:
         """ On Newton convergence, update STATE for all variables."""
-        self.assembler.distribute_variable(solution)
+        if self._state_buffer is not None:
+            self._ensure_state_buffers()
+            np.copyto(self._state_buffer, solution)
+        else:
+            self.assembler.distribute_variable(solution)
         self.export_step()
 
     def after_newton_failure(self, solution, errors, iteration_counter) -> None:
@@ -138,48 +260,210 @@ class CommonAbstractModel(AbstractModel):
                 "Convergence check for non-linear problems is not yet implemented"
             )
 
+    def rediscretize(self, filt: pp.assembler_filters.AssemblerFilter) -> None:
+        """Discretize the terms passing the filter
+
+        Independent grids and interfaces are discretized in parallel if
+        params.discretization_threads > 1, see DiscretizationScheduler.
+        """
+        threads = self.params.discretization_threads
+        if threads <= 1:
+            self.assembler.discretize(filt)
+            return
+        if self.discretization_scheduler is None:
+            self.discretization_scheduler = DiscretizationScheduler(threads)
+        self.discretization_scheduler.discretize(self.gb, filt)
+
     def assemble_matrix_rhs(self):
         """Wrapper for assembler.assemble_matrix_rhs
 
         Wrap the assembler method so it can be overwritten elsewhere.
+        If incremental assembly is enabled, the matrix is overwritten in place by
+        the next assembly.
         """
+        if self.incremental_assembly is not None:
+            return self.incremental_assembly.assemble(self.assembler)
         A, b = self.assembler.assemble_matrix_rhs()
         return A, b
 
-    @timer(logger, level="INFO")
-    def assemble_and_solve_linear_system(self, tol: float) -> np.ndarray:
-        """ Assemble a solve the linear system"""
+    def nonlinear_residual_norm(self, x: np.ndarray) -> float:
+        """Norm of the nonlinear residual ||b - A x|| at the current iterate x
 
+        The system is assembled at the current iterate, which must be x. It is
+        reused by the next call to assemble_and_solve_linear_system(), unless
+        before_newton_iteration() or after_newton_iteration() is called in between.
+        """
         A, b = self.assemble_matrix_rhs()
+        self._assembled_system = (A, b)
+        return float(np.linalg.norm(b - A * x))
+
+    @timer(logger, level="INFO")
+    def assemble_and_solve_linear_system(
+        self,
+        tol: Union[float, Callable[[float], float]],
+        x0: Optional[np.ndarray] = None,
+        reuse_factorization: bool = False,
+    ) -> np.ndarray:
+        """Assemble a solve the linear system
+
+        Parameters
+        ----------
+        tol : float or Callable
+            tolerance of an iterative linear solver, relative to the initial
+            residual. The direct solver ignores it. If callable, the tolerance is
+            computed from the norm of the nonlinear residual, ||b - A x0||
+            (e.g. Eisenstat-Walker forcing terms).
+        x0 : np.ndarray, Optional
+            current Newton iterate. Used as initial guess for iterative solvers.
+            Defaults to the state vector. If the system was assembled by
+            nonlinear_residual_norm(), x0 must be the iterate it was evaluated at.
+        reuse_factorization : bool
+            take a chord step from x0 with the previous factorization of the direct
+            solver, instead of factorizing the new matrix.
+        """
 
-        # Estimate condition number
+        assembled, self._assembled_system = self._assembled_system, None
+        if assembled is not None:
+            A, b = assembled
+        else:
+            A, b = self.assemble_matrix_rhs()
+
+        # Scaling of the matrix. These ratios are not condition numbers, see
+        # estimate_condition_number().
         logger.info(f"Max element in A {np.max(np.abs(A)):.2e}")
         logger.info(
             f"Max {np.max(np.sum(np.abs(A), axis=1)):.2e} and "
             f"min {np.min(np.sum(np.abs(A), axis=1)):.2e} A sum."
         )
 
-        # UMFPACK Estimate of condition number
         sum_diag_abs_A = np.abs(A.diagonal())
         logger.info(
-            f"UMFPACK Condition number estimate: "
+            f"Ratio of min to max absolute diagonal of A: "
             f"{np.min(sum_diag_abs_A) / np.max(sum_diag_abs_A) :.2e}"
         )
 
+        if self.linear_solver is None:
+            self.initialize_linear_solver()
+
+        # Eliminate local unknowns
+        condensation = self.static_condensation
+        if condensation is not None:
+            A_full, b_full = A, b
+            A, b = condensation.condense(A, b)
+            x0 = self.get_state_vector() if x0 is None else x0
+            x0 = condensation.restrict(x0)
+
+        if callable(tol):
+            x0 = self.get_state_vector() if x0 is None else x0
+            residual_norm = np.linalg.norm(b - A * x0)
+            tol = tol(residual_norm)
+            logger.info(f"Nonlinear residual {residual_norm:.2e}. Linear tol {tol:.1e}")
+
+        tic = time.time()
+        logger.info(f"Solve Ax=b using {self.params.linear_solver}")
+        if isinstance(self.linear_solver, (FixedStressGMRES, AMGSolver)):
+            sol = self.linear_solver.solve(A, b, tol=tol, x0=x0)
+        elif reuse_factorization:
+            x0 = self.get_state_vector() if x0 is None else x0
+            sol = self.linear_solver.chord_solve(A, b, x0)
+        else:
+            # Reuse the factorization if A is unchanged, e.g. for linear problems.
+            # Time-dependent models also require an unchanged time step.
+            key = getattr(self, "time_step", None)
+            sol = self.linear_solver.solve(A, b, key=key)
+            if self.params.estimate_condition_number:
+                estimate = condition_number_estimate(A, self.linear_solver)
+                logger.info(f"Condition number estimate: {estimate['cond_1']:.2e}")
+
+        # Recover the eliminated unknowns
+        if condensation is not None:
+            sol = condensation.expand(sol)
+            A, b = A_full, b_full
+        logger.info(f"Done. Elapsed time {time.time() - tic}")
+        norm = np.linalg.norm(b - A * sol)
+        logger.info(f"||b-Ax|| = {norm}")
+
+        rhs_norm = np.linalg.norm(b)
+        identical_zero = np.isclose(rhs_norm, 0) and np.isclose(norm, 0)
+        rel_norm = norm / rhs_norm if not identical_zero else norm
+        logger.info(f"||b-Ax|| / ||b|| = {rel_norm}")
+        return sol
+
+    @timer(logger, level="INFO")
+    def solve_many(self, rhs: Union[np.ndarray, List[np.ndarray]]) -> np.ndarray:
+        """Solve the linear system for several right-hand sides
+
+        The matrix is assembled and factorized once, and all right-hand sides
+        are solved in one call to the direct solver. Use e.g. for sweeps over
+        parameters that only enter the right-hand side.
+
+        Parameters
+        ----------
+        rhs : np.ndarray or List[np.ndarray]
+            right-hand sides, either as columns of an array or as a list.
+
+        Returns
+        -------
+        np.ndarray
+            solutions, one per column
+        """
+        if isinstance(rhs, list):
+            rhs = np.column_stack(rhs)
+
+        A, _ = self.assemble_matrix_rhs()
+        if isinstance(self.linear_solver, PardisoSolver) and (
+            self.static_condensation is None
+        ):
+            solver = self.linear_solver
+        else:
+            solver = PardisoSolver(equilibration=self.params.equilibration)
+        solver.factorize(A, key=getattr(self, "time_step", None))
+
+        logger.info(f"Solve for {rhs.shape[1]} right-hand sides using pypardiso")
+        return solver.apply(rhs)
+
+    def estimate_condition_number(self) -> float:
+        """Estimate of the 1-norm condition number of the assembled system
+
+        See condition_number_estimate. The factorization of the linear solver is
+        reused if it is of the assembled matrix, e.g. after the last Newton
+        iteration. Returns nan if the estimate fails, e.g. for a singular matrix.
+        """
+        A, _ = self.assemble_matrix_rhs()
+        A = sps.csr_matrix(A)
+        solver = getattr(self, "linear_solver", None)
+        if not isinstance(solver, PardisoSolver) or not solver.is_factorized(
+            A, solver.fingerprint(A, key=getattr(self, "time_step", None))
+        ):
+            solver = None
+        try:
+            return condition_number_estimate(A, solver)["cond_1"]
+        except (ValueError, PyPardisoError) as e:
+            logger.warning(f"Condition number estimate failed: {e}")
+            return np.nan
+
+    @timer(logger, level="INFO")
+    def initialize_linear_solver(self) -> None:
+        """Initialize linear solver
+
+        The direct solver is available for all models. Coupled models may
+        define additional solvers, see e.g. ContactMechanicsBiotBase.
+        See also self.assemble_and_solve_linear_system()
+
+        The sparsity pattern of the system does not change between Newton
+        iterations and time steps. The solver is therefore kept for the entire
+        simulation, so that reordering and symbolic factorization is done only once.
+        """
+
+        # The condition number can be estimated by condition_number_estimate,
+        # see also BaseParameters.estimate_condition_number.
+
         if self.params.linear_solver == "direct":
-            tic = time.time()
-            logger.info("Solve Ax=b using scipy")
-            # sol = spla.spsolve(A, b)
-            sol = spsolve(A, b)  # pypardiso
-            logger.info(f"Done. Elapsed time {time.time() - tic}")
-            norm = np.linalg.norm(b - A * sol)
-            logger.info(f"||b-Ax|| = {norm}")
-
-            rhs_norm = np.linalg.norm(b)
-            identical_zero = np.isclose(rhs_norm, 0) and np.isclose(norm, 0)
-            rel_norm = norm / rhs_norm if not identical_zero else norm
-            logger.info(f"||b-Ax|| / ||b|| = {rel_norm}")
-            return sol
+            self.linear_solver = PardisoSolver(equilibration=self.params.equilibration)
+            layout = self.dof_layout
+            self.linear_solver.blocks = [
+                layout.block_dofs(key) for key in layout.block_keys
+            ]
 
         else:
             raise ValueError(f"Unknown linear solver {self.params.linear_solver}")
@@ -59,6 +59,7 @@ class ISCBoxModel(ISCBiotContactMechanics):
     def gb(self, gb: pp.GridBucket):
         """ Set a grid bucket to the class"""
         self._gb = gb
+        self.clear_aperture_cache()
         if gb is not None:
             self.bounding_box = gb.bounding_box(as_dict=True)
         # else:
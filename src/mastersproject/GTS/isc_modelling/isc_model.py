@@ -1,12 +1,19 @@
 import logging
 import time
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 
 import porepy as pp
 from GTS import ContactMechanicsBiotBase
+from GTS.isc_modelling.assembly import IncrementalAssembler
+from GTS.isc_modelling.discretization import partial_update
 from GTS.isc_modelling.ISCGrid import create_grid
+from GTS.isc_modelling.mechanics import Mechanics
+from GTS.isc_modelling.mortar_projections import (
+    IntersectionProjection,
+    assemble_mortar_projections,
+)
 from GTS.isc_modelling.parameter import BiotParameters
 from mastersproject.util.logging_util import timer, trace
 
@@ -18,6 +25,15 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         super().__init__(params)
         self.params = params
 
+        # Apertures, specific volumes and permeabilities of the current state and
+        # iterate, keyed by (field, grid, scaled, from_iterate).
+        # See clear_aperture_cache.
+        self._aperture_cache: Dict[Tuple, np.ndarray] = {}
+        self._intersection_projection: Optional[IntersectionProjection] = None
+        # Diffusion-tensor permeabilities of the last discretization of the diffusion
+        # term, by grid. See rediscretize_diffusion.
+        self._discretized_permeability: Dict[pp.Grid, np.ndarray] = {}
+
     # --- Grid methods ---
 
     def create_grid(self):
@@ -67,6 +83,7 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
     def gb(self, gb: pp.GridBucket):
         """Set a grid bucket to the class"""
         self._gb = gb
+        self.clear_aperture_cache()
         if gb is None:
             return
         pp.contact_conditions.set_projections(self.gb)
@@ -126,8 +143,14 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         Typically equals 1 in Nd, the aperture in codimension 1 and the square/cube
         of aperture in codimensions 2 and 3.
         """
-        a = self.aperture(g, scaled, from_iterate)
-        return np.power(a, self.Nd - g.dim)
+
+        def _specific_volume():
+            a = self.aperture(g, scaled, from_iterate)
+            return np.power(a, self.Nd - g.dim)
+
+        return self._cached(
+            "specific_volume", g, scaled, from_iterate, _specific_volume
+        )
 
     def aperture(
         self, g: pp.Grid, scaled: bool, from_iterate: bool = True,
@@ -149,11 +172,69 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         area/volume (or "specific volume") for intersections of co-dimension 2 and 3.
         See also specific_volume.
         """
-        a_init = self.compute_initial_aperture(g, scaled=scaled)
-        a_mech = self.mechanical_aperture(g, scaled=scaled, from_iterate=from_iterate)
 
-        a_total = a_init + a_mech
-        return a_total
+        def _aperture():
+            a_init = self.compute_initial_aperture(g, scaled=scaled)
+            a_mech = self.mechanical_aperture(
+                g, scaled=scaled, from_iterate=from_iterate
+            )
+            return a_init + a_mech
+
+        return self._cached("aperture", g, scaled, from_iterate, _aperture)
+
+    def _cached(
+        self,
+        field: str,
+        g: pp.Grid,
+        scaled: bool,
+        from_iterate: bool,
+        compute: Callable[[], np.ndarray],
+    ) -> np.ndarray:
+        """Fetch an aperture-dependent field from the cache, or compute it
+
+        The cached arrays are shared by all consumers, and are therefore read-only.
+        """
+        key = (field, g, scaled, from_iterate)
+        if key not in self._aperture_cache:
+            values = compute()
+            values.setflags(write=False)
+            self._aperture_cache[key] = values
+        return self._aperture_cache[key]
+
+    def intersection_projection(self) -> IntersectionProjection:
+        """ Projection of fracture cell values to the sides of intersection cells"""
+        if (
+            self._intersection_projection is None
+            or self._intersection_projection.gb is not self.gb
+        ):
+            self._intersection_projection = IntersectionProjection(self.gb)
+        return self._intersection_projection
+
+    def clear_aperture_cache(self) -> None:
+        """Clear the cached apertures, specific volumes and permeabilities
+
+        Must be called whenever the mortar displacements in the state or the
+        iterate change.
+        """
+        self._aperture_cache = {}
+
+    def diffusion_permeability(self, g: pp.Grid) -> np.ndarray:
+        """ Permeability times specific volume of the iterate, scaled"""
+        return self.permeability(g, scaled=True) * self.specific_volume(g, scaled=True)
+
+    def changed_permeability_cells(self, g: pp.Grid, rtol: float) -> np.ndarray:
+        """Cells where the permeability changed since the last discretization
+
+        The permeability includes the specific volume, as in the diffusion tensor.
+        The relative change is computed from the cached permeabilities of the
+        iterate. All cells are reported if the permeability of the last
+        discretization is not recorded, see discretize().
+        """
+        reference = self._discretized_permeability.get(g)
+        if reference is None:
+            return np.arange(g.num_cells)
+        k = self.diffusion_permeability(g)
+        return np.flatnonzero(np.abs(k - reference) > rtol * np.abs(reference))
 
     def mechanical_aperture(
         self, g: pp.Grid, scaled: bool, from_iterate: bool
@@ -232,41 +313,30 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         #  for fracture intersections where either side of fracture has different aperture.
         # In fracture intersections
         elif g.dim == nd - 2:
-            # (g is the secondary grid.)
-            # Fetch edges of g that points to a higher-dimensional grid
-            intx_edges = [(g, g_h) for g_h in primary_grids]
-            frac_edges = [(g_h, nd_grid) for g_h in primary_grids]
-            frac_cell_faces = [g_h.cell_faces for g_h in primary_grids]
-
-            # get apertures on the adjacent fractures
-            data_edges = [gb.edge_props(edge) for edge in frac_edges]
-            frac_apertures = [
-                _aperture_from_edge(data_edge) for data_edge in data_edges
-            ]
-
-            # Map fracture apertures to internal faces ..
-            frac_face_apertures = [
-                np.abs(cell_face) * parent_aperture
-                for cell_face, parent_aperture in zip(frac_cell_faces, frac_apertures)
-            ]
+            # Apertures of all intersections are computed in one pass, and cached.
+            def _intersection_apertures():
+                fractures = gb.grids_of_dimension(nd - 1)
+                frac_apertures = [
+                    _aperture_from_edge(gb.edge_props((g_h, nd_grid)))
+                    for g_h in fractures
+                ]
+                # Map fracture apertures to internal faces, then project face
+                # apertures to the interfaces and take maximum over the sides of
+                # each intersection cell (assuming a conforming mesh).
+                # Note: for matching grids, avg and int mortar projections are
+                # identical.
+                return self.intersection_projection().max(
+                    np.concatenate(frac_apertures)
+                )
 
-            # .. then project face apertures to the interfaces and take maximum
-            # Note: for matching grids, avg and int mortar projections are identical.
-            mortar_grids = [gb.edge_props(edge)["mortar_grid"] for edge in intx_edges]
-            mortar_apertures = [
-                mg.primary_to_mortar_int() * ap
-                for mg, ap in zip(mortar_grids, frac_face_apertures)
-            ]
-            # The reshape and max operations implicitly project the aperture to
-            # the intersection grid (assuming a conforming mesh).
-            intx_max_apertures = np.max(
-                np.vstack(
-                    [mortar_ap.reshape((2, -1)) for mortar_ap in mortar_apertures]
-                ),
-                axis=0,
+            intx_max_apertures = self._cached(
+                "intersection_mechanical_aperture",
+                None,
+                scaled,
+                from_iterate,
+                _intersection_apertures,
             )
-
-            return intx_max_apertures
+            return self.intersection_projection().restrict(intx_max_apertures, g).copy()
 
         else:
             raise ValueError("Not implemented 1d intersection points")
@@ -279,7 +349,12 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         Modify parent method by passing from_iterate argument. This argument is
         needed by self.aperture().
         """
-        return super().permeability(g, scaled, from_iterate=from_iterate)
+
+        def _permeability():
+            parent = super(ISCBiotContactMechanics, self)
+            return parent.permeability(g, scaled, from_iterate=from_iterate)
+
+        return self._cached("permeability", g, scaled, from_iterate, _permeability)
 
     def intersection_volume_iterate(self, g):
         if g.dim == self.Nd - 2:
@@ -314,19 +389,16 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
 
     def assemble_matrix_rhs(self):
         """ Modify global assembly to get constant pressure in tunnels"""
-        A, b = self.assembler.assemble_matrix_rhs(matrix_format="csr")
+        A, b = super().assemble_matrix_rhs()
 
         # Start of tunnel equilibration
         if self.time > -self.params.tunnel_equilibrium_time:
             pressure = self.params.tunnel_pressure * (
                 pp.PASCAL / self.params.scalar_scale
             )
-            rows_to_zero = self.inds_tunnel_scalar()
-            # Modify global matrix and rhs
-            self.csr_zero_rows(A, rows_to_zero)
-            for glob_ind in rows_to_zero:
-                A[glob_ind, glob_ind] = 1
-                b[glob_ind] = pressure
+            # Replace the tunnel equations by identity rows, in place
+            constraint = self.dof_constraint("tunnel", self.inds_tunnel_scalar)
+            A, b = constraint.apply(A, b, pressure)
 
         return A, b
 
@@ -344,23 +416,6 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         )
         return rows_to_zero
 
-    def csr_zero_rows(self, csr, rows_to_zero):
-        """Efficient way to set csr sparse matrix row to zero.
-
-        https://stackoverflow.com/questions/19784868/
-        what-is-most-efficient-way-of-setting-row-to-zeros-for-a-sparse-scipy-matrix/
-        19800305#19800305"""
-        rows, cols = csr.shape
-        mask = np.ones((rows,), dtype=np.bool)
-        mask[rows_to_zero] = False
-        nnz_per_row = np.diff(csr.indptr)
-
-        mask = np.repeat(mask, nnz_per_row)
-        nnz_per_row[rows_to_zero] = 0
-        csr.data = csr.data[mask]
-        csr.indices = csr.indices[mask]
-        csr.indptr[1:] = np.cumsum(nnz_per_row)
-
     def tag_tunnel_cells(self):
         """Tag tunnel-shearzone intersections
 
@@ -415,33 +470,33 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
 
     # --- Set flow parameters ---
 
-    def set_scalar_parameters(self):
+    def mass_weight(self, g: pp.Grid) -> np.ndarray:
+        """ See parent method
+
+        We set a more complex storage term that depends on the Biot coefficient
+            mw = porosity * c + (alpha - porosity) / K
+        Note: alpha and porosity are 1.0 in fractures,
+              then mass_weight reduces to 'phi * c'.
+        """
+        c = self.params.fluid.COMPRESSIBILITY
+        porosity = self.porosity(g)
+        alpha = self.biot_alpha(g)
+        bulk = self.params.rock.BULK_MODULUS
+        mass_weight = porosity * c + (alpha - porosity) / bulk
+        mass_weight *= self.specific_volume(g, scaled=True)
+        return mass_weight
+
+    def set_scalar_iterate_parameters(self) -> None:
         """ See parent method
 
-        Overwrite mass_weight and source.
-        * For mass_weight, we set a more complex storage term that depends on the Biot coefficient
-        * For source, we add a source term for the impact of expansion and contraction
-            of 1d fracture intersections (see intersection_volume_iterate).
+        Add a source term for the impact of expansion and contraction
+        of 1d fracture intersections (see intersection_volume_iterate).
         """
-        super().set_scalar_parameters()
+        super().set_scalar_iterate_parameters()
         for g, d in self.gb:
-            params: pp.Parameters = d[pp.PARAMETERS]
-            scalar_params: dict = params[self.scalar_parameter_key]
-
-            # Set mass weight for the biot problem
-            #   mw = porosity * c + (alpha - porosity) / K
-            #   Note: alpha and porosity are 1.0 in fractures,
-            #         then mass_weight reduces to 'phi * c'.
-            c = self.params.fluid.COMPRESSIBILITY
-            porosity = self.porosity(g)
-            alpha = self.biot_alpha(g)
-            bulk = self.params.rock.BULK_MODULUS
-            mass_weight = porosity * c + (alpha - porosity) / bulk
-            mass_weight *= self.specific_volume(g, scaled=True)
-            scalar_params["mass_weight"] = mass_weight
-
-            # Set intersection transient source term
-            scalar_params["source"] += self.intersection_volume_iterate(g)
+            scalar_params: dict = d[pp.PARAMETERS][self.scalar_parameter_key]
+            source = self.source_scalar(g) + self.intersection_volume_iterate(g)
+            scalar_params["source"] = source
 
     # --- Other flow related methods ---
 
@@ -622,11 +677,49 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         """
         if self.gb is None:
             super()._prepare_grid()
+        assemble_mortar_projections(self.gb)
         self.well_cells()  # tag well cells
         self.tag_tunnel_cells()  # tag tunnel cells
+        self.set_initial_aperture()
+        self.clear_aperture_cache()
+        self._discretized_permeability = {}
+
+    def discretize(self) -> None:
+        """Discretize all terms
+
+        With a rediscretization tolerance, the permeabilities of this discretization
+        are recorded. The first Newton iteration then only updates the diffusion
+        term near cells with changed permeability, see rediscretize_diffusion().
+        """
+        super().discretize()
+        if self.params.rediscretization_tolerance is not None:
+            for g, _ in self.gb:
+                self._discretized_permeability[g] = self.diffusion_permeability(g)
+
+    @staticmethod
+    def iterate_independent_terms() -> List[str]:
+        """Terms that are unchanged within a time step
+
+        These terms are neither re-discretized nor, with incremental assembly,
+        re-assembled in the Newton iterations.
+        """
+        return ["grad_p", "div_u", "stabilization", "mpsa"]
+
+    def before_newton_loop(self) -> None:
+        """ Update parameters, and reassemble the static terms in the next iteration"""
+        super().before_newton_loop()
+        if not self.params.incremental_assembly:
+            return
+        if self.incremental_assembly is None:
+            self.incremental_assembly = IncrementalAssembler(
+                self.iterate_independent_terms()
+            )
+        self.incremental_assembly.invalidate()
 
     @timer(logger, level="INFO")
     def before_newton_iteration(self) -> None:
+        # Skip Mechanics.before_newton_iteration, the friction term is handled below.
+        super(Mechanics, self).before_newton_iteration()
         # Note: All parameters are updated *after* each Newton iteration.
 
         # Re-discretize the nonlinear term and all terms depending on the aperture
@@ -637,10 +730,25 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         # In other words: We want to update the ..
         #   .. MPFA terms (k depends on aperture).
         #   .. Mass terms (depends on specific volume / aperture).
+        # With a rediscretization tolerance, the MPFA terms are only updated near
+        # cells where the permeability changed, see rediscretize_diffusion().
+        # With a friction reuse tolerance, the friction term is only updated on
+        # interfaces where the contact changed, see rediscretize_friction().
+        skip_terms = self.iterate_independent_terms()
+        partial = self.params.rediscretization_tolerance is not None
+        reuse_friction = self.params.friction_reuse_tolerance is not None
+        if partial:
+            skip_terms = skip_terms + ["diffusion"]
+        if reuse_friction:
+            skip_terms = skip_terms + [self.friction_coupling_term]
         term_filter = pp.assembler_filters.ListFilter(
-            term_list=["!grad_p", "!div_u", "!stabilization", "!mpsa"]
+            term_list=["!" + term for term in skip_terms]
         )
-        self.assembler.discretize(term_filter)
+        self.rediscretize(term_filter)
+        if partial:
+            self.rediscretize_diffusion()
+        if reuse_friction:
+            self.rediscretize_friction()
         # Report on cells sticking, sliding, etc.:
         msg = "(Open,Sticking,Gliding)/Total: "
         for g, d in self.gb:
@@ -656,11 +764,55 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
             msg += f"{sz}: ({nopen}, {nsticking}, {nsliding})/{sliding.size}. "
         logger.info(msg)
 
+    @timer(logger)
+    def rediscretize_diffusion(self) -> None:
+        """Re-discretize the diffusion term near cells with changed permeability
+
+        Grids without changes are skipped. Grids where more than half of the cells
+        changed, or without a recorded permeability, are fully re-discretized.
+        Otherwise, only the stencils of the faces near the changed cells are
+        updated, see partial_update().
+        """
+        rtol = self.params.rediscretization_tolerance
+        num_updated = 0
+        for g, d in self.gb:
+            cells = self.changed_permeability_cells(g, rtol)
+            if cells.size == 0:
+                continue
+            num_updated += cells.size
+
+            discr = d[pp.DISCRETIZATION][self.scalar_variable]["diffusion"]
+            k = self.diffusion_permeability(g)
+            reference = self._discretized_permeability.get(g)
+            if reference is None or cells.size > g.num_cells / 2:
+                discr.discretize(g, d)
+                self._discretized_permeability[g] = k.copy()
+            else:
+                partial_update(discr, g, d, cells)
+                reference[cells] = k[cells]
+        logger.info(f"Re-discretized diffusion near {num_updated} changed cells")
+
+    def initial_biot_condition(self) -> None:
+        """ Set initial guess for the variables, and clear the aperture cache"""
+        super().initial_biot_condition()
+        self.clear_aperture_cache()
+
+    def update_state(self, solution_vector: np.ndarray) -> None:
+        """ Update the iterate, and clear the aperture cache"""
+        super().update_state(solution_vector)
+        self.clear_aperture_cache()
+
+    def after_newton_convergence(self, solution, errors, iteration_counter) -> None:
+        """ Update STATE, and clear the aperture cache"""
+        super().after_newton_convergence(solution, errors, iteration_counter)
+        self.clear_aperture_cache()
+
     def after_newton_iteration(self, solution_vector: np.ndarray) -> None:
         super().after_newton_iteration(solution_vector)
         # Update Biot parameters using aperture from iterate
         # (i.e. displacements from iterate)
-        self.set_biot_parameters()
+        self.stale_parameters.add("iterate")
+        self.update_biot_parameters()
 
     # --- Exporting and visualization ---
 
@@ -738,12 +890,13 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
         self.neg_ind = neg_ind  # noqa
         self.negneg_ind = negneg_ind  # noqa
 
-        # Condition number
+        # Condition number, and the max/min ratios of the row sums and diagonal
         A, _ = self.assembler.assemble_matrix_rhs()  # noqa
         row_sum = np.sum(np.abs(A), axis=1)
-        pp_cond = np.max(row_sum) / np.min(row_sum)
+        row_sum_ratio = np.max(row_sum) / np.min(row_sum)
         diag = np.abs(A.diagonal())
-        umfpack_cond = np.max(diag) / np.min(diag)
+        diag_ratio = np.max(diag) / np.min(diag)
+        cond_1 = self.estimate_condition_number()
 
         summary_param = (
             f"\nSummary of relevant parameters:\n"
@@ -753,8 +906,9 @@ class ISCBiotContactMechanics(ContactMechanicsBiotBase):
             f"{np.mean(self.permeability(self._nd_grid(), scaled=False)):.2e}\n"
             f"time step: {self.time_step / pp.HOUR:.4f} hours\n"
             f"3d cells: {g.num_cells}\n"
-            f"pp condition number: {pp_cond:.2e}\n"
-            f"umfpack condition number: {umfpack_cond:.2e}\n"
+            f"row sum ratio (max/min): {row_sum_ratio:.2e}\n"
+            f"diagonal ratio (max/min): {diag_ratio:.2e}\n"
+            f"condition number (1-norm estimate): {cond_1:.2e}\n"
         )
 
         scalar_parameters = d[pp.PARAMETERS][self.scalar_parameter_key]
@@ -0,0 +1,795 @@
+""" Linear solvers for the assembled mixed-dimensional systems"""
+import hashlib
+import inspect
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse as sps
+import scipy.sparse.linalg as spla
+from pypardiso.pardiso_wrapper import PyPardisoSolver
+
+logger = logging.getLogger(__name__)
+
+# The relative tolerance of scipy's gmres was renamed from tol to rtol in scipy 1.12
+_GMRES_TOL = "rtol" if "rtol" in inspect.signature(spla.gmres).parameters else "tol"
+
+
+class PardisoSolver(PyPardisoSolver):
+    """Direct solver that reuses the PARDISO symbolic factorization
+
+    The sparsity pattern of the assembled systems rarely changes within a run.
+    The reordering and symbolic analysis (PARDISO phase 11) is therefore done
+    once per sparsity pattern. Subsequent calls with a matrix of the same pattern
+    only do numerical factorization and solve (phase 23).
+    If the matrix is identical to the factorized one, e.g. for linear problems
+    with constant time step, only the solve (phase 33) is done. Matrices are
+    compared by a fingerprint of the values, see fingerprint().
+
+    The analysis phase also computes scaling and matching vectors from the matrix
+    values. If the values drift far from those of the analysed matrix, the reused
+    analysis may give an inaccurate solution. We therefore monitor the relative
+    residual, and redo the analysis if it grows by more than a factor
+    residual_growth compared to the residual after the last analysis.
+
+    Optionally, the system is equilibrated before factorization, i.e. we solve
+    (R A C) y = R b and set x = C y for diagonal row and column scalings R, C,
+    see equilibrate().
+
+    Parameters
+    ----------
+    residual_growth : float
+        accepted growth of the relative residual before the analysis is redone.
+    equilibration : str, Optional
+        "ruiz", "block" or None (default). See equilibrate().
+    """
+
+    def __init__(self, residual_growth: float = 1e2, equilibration: str = None):
+        super().__init__(mtype=11)
+        self.residual_growth = residual_growth
+
+        if equilibration not in [None, "ruiz", "block"]:
+            raise ValueError(f"Unknown equilibration {equilibration}")
+        self.equilibration = equilibration
+        # Dofs of each block of the system, for block equilibration
+        self.blocks: List[np.ndarray] = []
+
+        # Sparsity pattern of the analysed matrix
+        self._indptr = np.zeros(0, dtype=np.int32)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._reference_residual = np.inf
+        # Fingerprint and scaling of the factorized matrix
+        self._fingerprint: Optional[Tuple] = None
+        self._row_scaling = np.ones(0)
+        self._col_scaling = np.ones(0)
+
+        # Statistics
+        self.num_analyses = 0
+        self.num_factorizations = 0
+        self.num_reused_factorizations = 0
+
+    def solve(self, A: sps.spmatrix, b: np.ndarray, key=None) -> np.ndarray:
+        """Solve Ax=b, reusing the factorization if possible
+
+        Parameters
+        ----------
+        A, b : sps.spmatrix, np.ndarray
+            linear system
+        key : hashable, Optional
+            additional identifier of the matrix, e.g. the time step. The
+            factorization of the previous matrix is reused only if key is
+            unchanged.
+        """
+        A = sps.csr_matrix(A)
+        self._check_A(A)
+        b = self._check_b(A, b)
+
+        fingerprint = self.fingerprint(A, key)
+        if self.is_factorized(A, fingerprint):
+            logger.info("Matrix is unchanged. Reuse numerical factorization.")
+            self.num_reused_factorizations += 1
+            return self.apply(b)
+
+        self._row_scaling, self._col_scaling = self.equilibrate(A)
+        A = self._scale_matrix(A)
+        b = _scale_vector(b, self._row_scaling)
+
+        if not self.has_pattern(A):
+            x = self._analyze_and_solve(A, b)
+        else:
+            self.set_phase(23)
+            x = self._call_pardiso(A, b)
+            self.num_factorizations += 1
+
+            residual = self._relative_residual(A, x, b)
+            if np.isinf(self._reference_residual):
+                # First solve after an analysis by factorize()
+                self._reference_residual = max(residual, np.finfo(float).eps)
+            elif residual > self.residual_growth * self._reference_residual:
+                logger.info(
+                    f"Relative residual {residual:.2e} with reused analysis exceeds "
+                    f"{self.residual_growth:.0e} x {self._reference_residual:.2e}. "
+                    f"Redo symbolic factorization."
+                )
+                x = self._analyze_and_solve(A, b)
+
+        self.factorized_A = A
+        self._fingerprint = fingerprint
+        return _scale_vector(x, self._col_scaling)
+
+    def factorize(self, A: sps.spmatrix, key=None) -> None:
+        """Numerical factorization of A, reusing the symbolic factorization if possible
+
+        Nothing is done if A is unchanged since the last factorization.
+        Use apply() to solve with the factorized matrix.
+        """
+        A = sps.csr_matrix(A)
+        self._check_A(A)
+        fingerprint = self.fingerprint(A, key)
+        if self.is_factorized(A, fingerprint):
+            self.num_reused_factorizations += 1
+            return
+
+        self._row_scaling, self._col_scaling = self.equilibrate(A)
+        A = self._scale_matrix(A)
+
+        b = np.zeros((A.shape[0], 1))
+        if self.has_pattern(A):
+            self.set_phase(22)
+        else:
+            self.set_phase(12)
+            self.num_analyses += 1
+            self._indptr = A.indptr.copy()
+            self._indices = A.indices.copy()
+            # The reference residual is set by the next solve() that factorizes
+            self._reference_residual = np.inf
+        self._call_pardiso(A, b)
+        self.num_factorizations += 1
+        self.factorized_A = A
+        self._fingerprint = fingerprint
+
+    @staticmethod
+    def fingerprint(A: sps.csr_matrix, key=None) -> Tuple:
+        """Cheap identifier of the values of A
+
+        The sparsity pattern is compared separately, see has_pattern().
+        """
+        digest = hashlib.blake2b(np.ascontiguousarray(A.data), digest_size=16)
+        return key, A.shape, A.nnz, digest.hexdigest()
+
+    def is_factorized(self, A: sps.csr_matrix, fingerprint: Tuple) -> bool:
+        """ Whether the current numerical factorization is of A"""
+        return fingerprint == self._fingerprint and self.has_pattern(A)
+
+    def chord_solve(self, A: sps.spmatrix, b: np.ndarray, x0: np.ndarray) -> np.ndarray:
+        """Chord step for Ax=b, using the factorization of a previous matrix
+
+        The step is x = x0 + A_f^-1 (b - A x0), where A_f is the factorized matrix.
+        Falls back to solve() if there is no factorization with the pattern of A.
+        """
+        A = sps.csr_matrix(A)
+        if self._fingerprint is None or not self.has_pattern(A):
+            return self.solve(A, b)
+        logger.info("Chord step with the previous factorization.")
+        self.num_reused_factorizations += 1
+        return x0 + self.apply(b - A * x0)
+
+    def apply(self, b: np.ndarray) -> np.ndarray:
+        """ Solve with the matrix factorized by the last call to factorize()"""
+        A = self.factorized_A
+        b = _scale_vector(self._check_b(A, b), self._row_scaling)
+        self.set_phase(33)
+        return _scale_vector(self._call_pardiso(A, b), self._col_scaling)
+
+    def apply_transpose(self, b: np.ndarray) -> np.ndarray:
+        """ Solve with the transpose of the factorized matrix"""
+        A = self.factorized_A
+        b = _scale_vector(self._check_b(A, b), self._col_scaling)
+        self.set_phase(33)
+        self.set_iparm(12, 2)
+        try:
+            x = self._call_pardiso(A, b)
+        finally:
+            self.set_iparm(12, 0)
+        return _scale_vector(x, self._row_scaling)
+
+    def has_pattern(self, A: sps.csr_matrix) -> bool:
+        """ Whether A has the sparsity pattern of the analysed matrix"""
+        return np.array_equal(A.indptr, self._indptr) and np.array_equal(
+            A.indices, self._indices
+        )
+
+    # --- Equilibration ---
+
+    def equilibrate(self, A: sps.csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+        """Row and column scaling vectors r, c such that diag(r) A diag(c) is balanced
+
+        "ruiz": Ruiz iterations, which scale all rows and columns to unit max norm.
+        "block": One symmetric scaling per block of dofs (i.e. per variable and
+            grid, see self.blocks), by the mean magnitude of the block diagonal.
+            This preserves the relative scaling within each variable.
+        None: No scaling.
+        """
+        if self.equilibration == "ruiz":
+            return ruiz_equilibration(A)
+        elif self.equilibration == "block":
+            scaling = block_equilibration(A, self.blocks)
+            return scaling, scaling
+        ones = np.ones(A.shape[0])
+        return ones, ones
+
+    def _scale_matrix(self, A: sps.csr_matrix) -> sps.csr_matrix:
+        """diag(r) A diag(c), preserving the sparsity pattern of A
+
+        A copy is returned also without equilibration. The factorized matrix is kept
+        by the solver, and A may be overwritten by the caller, see
+        IncrementalAssembler.
+        """
+        if self.equilibration is None:
+            return A.copy()
+        rows = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+        A = A.copy()
+        A.data *= self._row_scaling[rows] * self._col_scaling[A.indices]
+        return A
+
+    # --- Helper methods ---
+
+    def _analyze_and_solve(self, A: sps.csr_matrix, b: np.ndarray) -> np.ndarray:
+        """ Reordering, symbolic and numerical factorization, and solve"""
+        self.set_phase(13)
+        x = self._call_pardiso(A, b)
+        self.num_analyses += 1
+        self.num_factorizations += 1
+
+        self._indptr = A.indptr.copy()
+        self._indices = A.indices.copy()
+        # Floor the reference to avoid re-analysis on round-off fluctuations
+        self._reference_residual = max(
+            self._relative_residual(A, x, b), np.finfo(float).eps
+        )
+        logger.info(f"Symbolic factorization done ({self.num_analyses} in total).")
+        return x
+
+    @staticmethod
+    def _relative_residual(A: sps.spmatrix, x: np.ndarray, b: np.ndarray) -> float:
+        """ Compute ||b - Ax|| / ||b||, or ||b - Ax|| if b = 0"""
+        norm = np.linalg.norm(b - A * x)
+        rhs_norm = np.linalg.norm(b)
+        return norm / rhs_norm if rhs_norm > 0 else norm
+
+    def free_memory(self, everything=False):
+        """ Release the factorization and forget the analysed pattern"""
+        super().free_memory(everything=everything)
+        self._indptr = np.zeros(0, dtype=np.int32)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._reference_residual = np.inf
+        self._fingerprint = None
+
+
+def condition_number_estimate(
+    A: sps.spmatrix,
+    solver: Optional[PardisoSolver] = None,
+    singular_values: bool = False,
+) -> Dict[str, float]:
+    """Estimate the condition number of A
+
+    The 1-norm condition number ||A||_1 ||A^-1||_1 is estimated by the
+    Hager-Higham algorithm (scipy's onenormest), which only requires a few
+    solves with A and its transpose. If a solver is passed, its factorization
+    is reused, and must be of A.
+
+    Optionally, the extreme singular values, and thus the 2-norm condition
+    number, are estimated by ARPACK. This is more expensive, as the smallest
+    singular value requires iterations with the inverse of A.
+
+    Parameters
+    ----------
+    A : sps.spmatrix
+    solver : PardisoSolver, Optional
+        solver holding the factorization of A. If not given, A is factorized.
+    singular_values : bool
+        Estimate the extreme singular values.
+
+    Returns
+    -------
+    Dict[str, float]
+        "cond_1": estimate of the 1-norm condition number.
+        If singular_values: also "sigma_max", "sigma_min" and "cond_2".
+    """
+    A = sps.csr_matrix(A)
+    if solver is None:
+        solver = PardisoSolver()
+        solver.factorize(A)
+    inverse = spla.LinearOperator(
+        A.shape,
+        matvec=solver.apply,
+        rmatvec=solver.apply_transpose,
+        matmat=solver.apply,
+        dtype=float,
+    )
+
+    estimate = {"cond_1": spla.norm(A, 1) * spla.onenormest(inverse)}
+    if singular_values:
+        sigma_max = spla.svds(A, k=1, return_singular_vectors=False)[0]
+        sigma_min = 1 / spla.svds(inverse, k=1, return_singular_vectors=False)[0]
+        estimate.update(
+            {
+                "sigma_max": sigma_max,
+                "sigma_min": sigma_min,
+                "cond_2": sigma_max / sigma_min,
+            }
+        )
+    return estimate
+
+
+def ruiz_equilibration(
+    A: sps.spmatrix, max_iterations: int = 10, tol: float = 1e-2
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Ruiz equilibration in the max-norm
+
+    Iteratively scale rows and columns by the inverse square root of their
+    max norm, until all rows and columns have max norm within tol of 1.
+
+    Returns
+    -------
+    row_scaling, col_scaling : np.ndarray
+    """
+    A = abs(sps.csr_matrix(A))
+    row_scaling = np.ones(A.shape[0])
+    col_scaling = np.ones(A.shape[1])
+    for _ in range(max_iterations):
+        row_norm = A.max(axis=1).toarray().ravel()
+        col_norm = A.max(axis=0).toarray().ravel()
+        if max(np.abs(1 - row_norm).max(), np.abs(1 - col_norm).max()) < tol:
+            break
+        # Empty rows or columns are not scaled
+        r = 1 / np.sqrt(np.where(row_norm > 0, row_norm, 1))
+        c = 1 / np.sqrt(np.where(col_norm > 0, col_norm, 1))
+        A = sps.diags(r) * A * sps.diags(c)
+        row_scaling *= r
+        col_scaling *= c
+    return row_scaling, col_scaling
+
+
+def block_equilibration(A: sps.spmatrix, blocks: List[np.ndarray]) -> np.ndarray:
+    """Symmetric scaling by one factor per block of dofs
+
+    The factor of a block is the inverse square root of the mean magnitude of its
+    non-zero diagonal entries, or of its largest entry if the diagonal is zero
+    (e.g. for the contact traction).
+
+    Returns
+    -------
+    scaling : np.ndarray
+        for both rows and columns
+    """
+    A = sps.csr_matrix(A)
+    diagonal = np.abs(A.diagonal())
+    scaling = np.ones(A.shape[0])
+    for dofs in blocks:
+        if dofs.size == 0:
+            continue
+        d = diagonal[dofs]
+        magnitude = np.mean(d[d > 0]) if np.any(d > 0) else abs(A[dofs]).max()
+        if magnitude > 0:
+            scaling[dofs] = 1 / np.sqrt(magnitude)
+    return scaling
+
+
+def _scale_vector(v: np.ndarray, scaling: np.ndarray) -> np.ndarray:
+    """ Scale the rows of a vector, or of each column of a 2d array"""
+    # pardiso expects column-major right-hand sides
+    return scaling * v if v.ndim == 1 else np.asfortranarray(scaling[:, None] * v)
+
+
+class FixedStressGMRES:
+    """GMRES with a block triangular fixed-stress preconditioner
+
+    The unknowns are split in a flow block (pressure and mortar fluxes) and a
+    mechanics block (displacement, mortar displacements and contact traction):
+
+        A = [[A_ff, A_fm],
+             [A_mf, A_mm]].
+
+    The preconditioner is the block lower triangular matrix
+
+        P = [[A_ff + L, 0],
+             [A_mf, A_mm]],
+
+    where L is the diagonal fixed-stress stabilization, typically
+    alpha^2 / K_dr * cell volume on the pressure dofs of the matrix. Applying P^-1
+    corresponds to one fixed-stress split iteration: first solve for flow with the
+    volumetric stress fixed, then solve for mechanics with the updated pressure.
+    The diagonal blocks are factorized by PARDISO once per outer solve, reusing
+    the symbolic factorizations between solves.
+
+    The previous solution is used as initial guess. Since the assembled system
+    is posed for the solution rather than for the Newton increment, this is the
+    current Newton iterate.
+
+    Parameters
+    ----------
+    tol : float
+        default tolerance on the residual, relative to the initial residual
+    restart, maxiter : int
+        GMRES restart length and maximum number of restart cycles
+    """
+
+    def __init__(self, tol: float = 1e-8, restart: int = 100, maxiter: int = 10):
+        self.tol = tol
+        self.restart = restart
+        self.maxiter = maxiter
+
+        # Block structure
+        self.flow_dofs = np.zeros(0, dtype=int)
+        self.mechanics_dofs = np.zeros(0, dtype=int)
+        self.stabilization = np.zeros(0)
+
+        # Block solvers
+        self.flow_solver = PardisoSolver()
+        self.mechanics_solver = PardisoSolver()
+
+        self._x_prev: Optional[np.ndarray] = None
+
+        # Statistics
+        self.num_iterations = 0
+
+    def set_block_structure(
+        self,
+        flow_dofs: np.ndarray,
+        mechanics_dofs: np.ndarray,
+        stabilization: np.ndarray,
+    ) -> None:
+        """Set the dofs of the flow and mechanics blocks
+
+        Parameters
+        ----------
+        flow_dofs, mechanics_dofs : np.ndarray
+            global indices of the flow and mechanics dofs
+        stabilization : np.ndarray
+            fixed-stress stabilization for each flow dof (in order of flow_dofs)
+        """
+        assert flow_dofs.size == stabilization.size
+        self.flow_dofs = flow_dofs
+        self.mechanics_dofs = mechanics_dofs
+        self.stabilization = stabilization
+        self._x_prev = None
+
+    def preconditioner(self, A: sps.spmatrix) -> spla.LinearOperator:
+        """ Factorize the diagonal blocks and return the action of P^-1"""
+        A = sps.csr_matrix(A)
+        f, m = self.flow_dofs, self.mechanics_dofs
+        A_ff = A[f][:, f] + sps.diags(self.stabilization)
+        A_mf = A[m][:, f]
+        A_mm = A[m][:, m]
+        self.flow_solver.factorize(A_ff)
+        self.mechanics_solver.factorize(A_mm)
+
+        def apply(r: np.ndarray) -> np.ndarray:
+            r = np.ravel(r)
+            x = np.zeros_like(r)
+            x[f] = self.flow_solver.apply(r[f])
+            x[m] = self.mechanics_solver.apply(r[m] - A_mf * x[f])
+            return x
+
+        return spla.LinearOperator(A.shape, matvec=apply, dtype=float)
+
+    def solve(
+        self,
+        A: sps.spmatrix,
+        b: np.ndarray,
+        tol: Optional[float] = None,
+        x0: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Solve Ax=b with preconditioned GMRES
+
+        Parameters
+        ----------
+        A, b : sps.spmatrix, np.ndarray
+            linear system
+        tol : float, Optional
+            tolerance relative to the initial residual, ||b - A x0||.
+            Defaults to self.tol.
+        x0 : np.ndarray, Optional
+            initial guess. Defaults to the previous solution.
+        """
+        num_dofs = self.flow_dofs.size + self.mechanics_dofs.size
+        if num_dofs != A.shape[0]:
+            raise ValueError(
+                f"Block structure has {num_dofs} dofs, but the system has "
+                f"{A.shape[0]} unknowns."
+            )
+        tol = self.tol if tol is None else tol
+
+        M = self.preconditioner(A)
+        if x0 is None:
+            x0 = self._x_prev if self._x_prev is not None else M * b
+        x, num_iterations = _gmres(A, b, M, x0, tol, self.restart, self.maxiter)
+        self.num_iterations += num_iterations
+        self._x_prev = x
+        return x
+
+    def free_memory(self, everything=False):
+        """ Release the block factorizations"""
+        self.flow_solver.free_memory(everything=everything)
+        self.mechanics_solver.free_memory(everything=everything)
+        self._x_prev = None
+
+
+class AMGSolver:
+    """GMRES preconditioned by a smoothed aggregation AMG hierarchy
+
+    Intended for the mixed-dimensional Darcy system of the flow models.
+    Setting up the hierarchy is the expensive part. It is therefore built once,
+    and reused as preconditioner for subsequent systems, e.g. after a change of
+    time step, until the sparsity pattern changes or reset() is called
+    (typically after a new discretization).
+
+    Requires pyamg.
+
+    Parameters
+    ----------
+    tol : float
+        default tolerance on the residual, relative to the initial residual
+    restart, maxiter : int
+        GMRES restart length and maximum number of restart cycles
+    """
+
+    def __init__(self, tol: float = 1e-8, restart: int = 50, maxiter: int = 20):
+        try:
+            import pyamg
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "The amg linear solver requires pyamg: pip install pyamg"
+            )
+        self._pyamg = pyamg
+
+        self.tol = tol
+        self.restart = restart
+        self.maxiter = maxiter
+
+        self.hierarchy = None
+        # Sparsity pattern of the matrix the hierarchy was built from
+        self._indptr = np.zeros(0, dtype=np.int32)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._x_prev: Optional[np.ndarray] = None
+
+        # Statistics
+        self.num_setups = 0
+        self.num_iterations = 0
+
+    def reset(self) -> None:
+        """ Discard the hierarchy. It is rebuilt on the next solve."""
+        self.hierarchy = None
+
+    def setup(self, A: sps.spmatrix) -> None:
+        """ Build the smoothed aggregation hierarchy for A"""
+        A = sps.csr_matrix(A)
+        self.hierarchy = self._pyamg.smoothed_aggregation_solver(
+            A, symmetry="nonsymmetric"
+        )
+        self._indptr = A.indptr.copy()
+        self._indices = A.indices.copy()
+        self.num_setups += 1
+        logger.info(f"AMG hierarchy built ({self.num_setups} in total).")
+        logger.info(self.hierarchy)
+
+    def solve(
+        self,
+        A: sps.spmatrix,
+        b: np.ndarray,
+        tol: Optional[float] = None,
+        x0: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Solve Ax=b with AMG preconditioned GMRES
+
+        Parameters
+        ----------
+        A, b : sps.spmatrix, np.ndarray
+            linear system
+        tol : float, Optional
+            tolerance relative to the initial residual, ||b - A x0||.
+            Defaults to self.tol.
+        x0 : np.ndarray, Optional
+            initial guess. Defaults to the previous solution.
+        """
+        A = sps.csr_matrix(A)
+        same_pattern = np.array_equal(A.indptr, self._indptr) and np.array_equal(
+            A.indices, self._indices
+        )
+        if self.hierarchy is None or not same_pattern:
+            self.setup(A)
+            self._x_prev = None
+        tol = self.tol if tol is None else tol
+
+        M = self.hierarchy.aspreconditioner(cycle="V")
+        if x0 is None:
+            x0 = self._x_prev if self._x_prev is not None else M * b
+
+        x, num_iterations = _gmres(A, b, M, x0, tol, self.restart, self.maxiter)
+        self.num_iterations += num_iterations
+
+        self._x_prev = x
+        return x
+
+
+class StaticCondensation:
+    """Elimination of cell-local unknowns by a Schur complement
+
+    The eliminated unknowns (e.g. the contact traction) are grouped in blocks of
+    block_size consecutive dofs, one block per cell. Each block is eliminated
+    by block_size rows of the system (the pivot rows), such that the square
+    pivot block is invertible:
+
+        [[A_PL, A_PO],  [x_L,   [b_P,
+         [A_QL, A_QO]]   x_O] =  b_Q],
+
+    which gives the condensed system for the other unknowns x_O,
+
+        (A_QO - A_QL A_PL^-1 A_PO) x_O = b_Q - A_QL A_PL^-1 b_P,
+
+    and x_L = A_PL^-1 (b_P - A_PO x_O).
+
+    The equations of the eliminated variable are used as pivot rows where
+    possible. For contact traction, the block of a cell is however singular
+    if the cell is e.g. closed (the normal condition is on the displacement
+    jump only). For such cells, the pivot rows are chosen by pivoted QR among
+    all rows coupling to the traction of the cell, i.e. also the mortar
+    displacement equations. A_PL must be block diagonal, which holds if the
+    mortar and fracture grids match.
+
+    Parameters
+    ----------
+    dofs : np.ndarray
+        global indices of the eliminated dofs, block_size consecutive dofs per cell.
+        The equations of the variable are assumed to be in the same rows.
+    block_size : int
+        number of dofs per cell
+    rcond : float
+        blocks with reciprocal condition number below rcond are not used as pivots
+    """
+
+    def __init__(self, dofs: np.ndarray, block_size: int, rcond: float = 1e-10):
+        assert dofs.size % block_size == 0
+        self.dofs = dofs
+        self.block_size = block_size
+        self.rcond = rcond
+
+        # Set by condense()
+        self.kept_dofs = np.zeros(0, dtype=int)
+        self._elimination: Optional[sps.spmatrix] = None
+        self._eliminated_rhs = np.zeros(0)
+
+    def condense(
+        self, A: sps.spmatrix, b: np.ndarray
+    ) -> Tuple[sps.csr_matrix, np.ndarray]:
+        """ Compute the Schur complement system for the kept dofs"""
+        A = sps.csr_matrix(A)
+        num_dofs = A.shape[0]
+        self.kept_dofs = np.setdiff1d(np.arange(num_dofs), self.dofs)
+
+        pivot_rows = self.pivot_rows(A)
+        other_rows = np.setdiff1d(np.arange(num_dofs), pivot_rows)
+
+        A_P = A[pivot_rows]
+        A_Q = A[other_rows]
+        inv_A_PL = self._invert_block_diagonal(A_P[:, self.dofs])
+        A_QL = A_Q[:, self.dofs]
+
+        self._elimination = (inv_A_PL * A_P[:, self.kept_dofs]).tocsr()
+        self._eliminated_rhs = inv_A_PL * b[pivot_rows]
+
+        S = A_Q[:, self.kept_dofs] - A_QL * self._elimination
+        b_S = b[other_rows] - A_QL * self._eliminated_rhs
+        return S.tocsr(), b_S
+
+    def expand(self, x_kept: np.ndarray) -> np.ndarray:
+        """ Recover the full solution from the solution of the condensed system"""
+        x = np.zeros(self.kept_dofs.size + self.dofs.size)
+        x[self.kept_dofs] = x_kept
+        x[self.dofs] = self._eliminated_rhs - self._elimination * x_kept
+        return x
+
+    def restrict(self, x: np.ndarray) -> np.ndarray:
+        """ Restrict a full vector to the kept dofs"""
+        return x[self.kept_dofs]
+
+    def pivot_rows(self, A: sps.csr_matrix) -> np.ndarray:
+        """ Rows used to eliminate each block of dofs, see class documentation"""
+        k = self.block_size
+        rows = self.dofs.copy()
+
+        blocks = self._diagonal_blocks(A[self.dofs][:, self.dofs])
+        singular = 1 / np.linalg.cond(blocks) < self.rcond
+        if not np.any(singular):
+            return rows
+
+        A_L = A[:, self.dofs].tocsc()
+        for i in np.where(singular)[0]:
+            cols = np.arange(i * k, (i + 1) * k)
+            candidates = np.unique(A_L[:, cols].indices)
+            block = A_L[candidates][:, cols].toarray()
+            _, r, pivots = scipy.linalg.qr(block.T, pivoting=True)
+            if abs(r[-1, k - 1]) < self.rcond * abs(r[0, 0]):
+                raise ValueError(f"Cannot eliminate the singular block {i}")
+            rows[cols] = candidates[np.sort(pivots[:k])]
+
+        if np.unique(rows).size != rows.size:
+            raise ValueError("Pivot rows of different blocks are not distinct")
+        return rows
+
+    def _diagonal_blocks(self, A: sps.spmatrix) -> np.ndarray:
+        """ Diagonal blocks of A, shape (num_blocks, block_size, block_size)"""
+        k = self.block_size
+        num_blocks = A.shape[0] // k
+        ind = np.arange(num_blocks * k)
+        rows = np.repeat(ind, k)
+        cols = np.repeat(ind // k * k, k) + np.tile(np.arange(k), ind.size)
+        return np.asarray(A[rows, cols]).reshape((num_blocks, k, k))
+
+    def _invert_block_diagonal(self, A: sps.spmatrix) -> sps.bsr_matrix:
+        """ Inverse of the block diagonal matrix A"""
+        blocks = self._diagonal_blocks(A)
+        if not np.isclose(np.abs(blocks).sum(), abs(A).sum()):
+            raise ValueError("Pivot block is not block diagonal")
+        num_blocks = blocks.shape[0]
+        return sps.bsr_matrix(
+            (np.linalg.inv(blocks), np.arange(num_blocks), np.arange(num_blocks + 1)),
+            shape=A.shape,
+        )
+
+
+def _gmres(
+    A: sps.spmatrix,
+    b: np.ndarray,
+    M: spla.LinearOperator,
+    x0: np.ndarray,
+    tol: float,
+    restart: int,
+    maxiter: int,
+) -> Tuple[np.ndarray, int]:
+    """Preconditioned GMRES with tolerance relative to the initial residual
+
+    Returns
+    -------
+    x : np.ndarray
+        solution
+    num_iterations : int
+        number of inner GMRES iterations
+    """
+    # Do not iterate below round-off, e.g. if x0 already solves the system
+    atol = max(
+        tol * np.linalg.norm(b - A * x0),
+        np.finfo(float).eps * np.linalg.norm(b),
+    )
+
+    num_iterations = 0
+
+    def count(_):
+        nonlocal num_iterations
+        num_iterations += 1
+
+    x, info = spla.gmres(
+        A,
+        b,
+        x0=x0,
+        restart=restart,
+        maxiter=maxiter,
+        M=M,
+        callback=count,
+        callback_type="pr_norm",
+        atol=atol,
+        **{_GMRES_TOL: 0.0},
+    )
+
+    if info > 0:
+        logger.warning(
+            f"GMRES did not converge to tolerance {tol:.1e} in "
+            f"{num_iterations} iterations."
+        )
+    elif info < 0:
+        raise ValueError(f"GMRES failed with illegal input (info={info})")
+    else:
+        logger.info(f"GMRES converged in {num_iterations} iterations.")
+    return x, num_iterations
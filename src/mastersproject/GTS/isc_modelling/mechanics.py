@@ -5,6 +5,8 @@ import numpy as np
 
 import porepy as pp
 from GTS.isc_modelling.general_model import CommonAbstractModel
+from GTS.isc_modelling.linear_solver import StaticCondensation
+from GTS.isc_modelling.mortar_projections import mortar_projection
 from GTS.isc_modelling.parameter import BaseParameters
 from mastersproject.util.logging_util import timer
 from porepy.params.data import add_nonpresent_dictionary
@@ -33,6 +35,13 @@ class Mechanics(CommonAbstractModel):
         # Terms of the equations
         self.friction_coupling_term = "fracture_force_balance"
 
+        # Contact traction and contact state at the last discretization of the
+        # friction coupling term, and whether the contact state was unchanged by it.
+        # By fracture. See rediscretize_friction.
+        self._friction_discretization: Dict[
+            pp.Grid, Tuple[np.ndarray, np.ndarray, bool]
+        ] = {}
+
     # --- Grid methods ---
 
     def create_grid(self):
@@ -316,6 +325,7 @@ class Mechanics(CommonAbstractModel):
         self.assign_mechanics_discretizations()
         self.initial_mechanics_condition()
         self.discretize()
+        self.bind_state_buffers()
         self.initialize_linear_solver()
 
         self.set_viz()
@@ -328,30 +338,22 @@ class Mechanics(CommonAbstractModel):
     def initialize_linear_solver(self) -> None:
         """Initialize linear solver
 
-        Currently, we only consider the direct solver.
-        See also self.assemble_and_solve_linear_system()
+        Optionally, the contact traction is eliminated by static condensation
+        before the linear solve, see StaticCondensation.
+        The pivot rows of the condensation depend on the contact state, so the
+        rows of the condensed system do not follow the variables of its columns.
+        Block equilibration, which scales rows and columns by the same block
+        factors, is therefore not allowed with condensation.
         """
-
-        # # Compute exact condition number:
-        # A, _ = self.assembler.assemble_matrix_rhs()
-        # cond = spla.norm(A, 1) * spla.norm(spla.inv(A), 1)
-        # logger.info(f"Exact condition number: {cond:.2e}")
-
-        if self.params.linear_solver == "direct":
-            """In theory, it should be possible to instruct SuperLU to reuse the
-            symbolic factorization from one iteration to the next. However, it seems
-            the scipy wrapper around SuperLU has not implemented the necessary
-            functionality, as discussed in
-
-                https://github.com/scipy/scipy/issues/8227
-
-            We will therefore pass here, and pay the price of long computation times.
-
-            """
-            pass
-
-        else:
-            raise ValueError(f"Unknown linear solver {self.params.linear_solver}")
+        super().initialize_linear_solver()
+        fracs = self.gb.grids_of_dimension(self.Nd - 1)
+        if self.params.condense_contact_traction and len(fracs) > 0:
+            if self.params.equilibration == "block":
+                raise ValueError(
+                    "Block equilibration is not supported with static condensation"
+                )
+            dofs = self.dof_layout.dofs(self.contact_traction_variable, dim=self.Nd - 1)
+            self.static_condensation = StaticCondensation(dofs, block_size=self.Nd)
 
     def _check_convergence_mechanics(
         self, solution, prev_solution, init_solution, nl_params
@@ -364,7 +366,7 @@ class Mechanics(CommonAbstractModel):
 
         # Get the solution from current and previous iterates,
         # as well as the initial guess.
-        mech_dof = self.assembler.dof_ind(g_max, var_m)
+        mech_dof = self.dof_layout.dofs(var_m, dim=g_max.dim)
         u_mech_now = solution[mech_dof] * ls
         u_mech_prev = prev_solution[mech_dof] * ls
         u_mech_init = init_solution[mech_dof] * ls
@@ -406,16 +408,9 @@ class Mechanics(CommonAbstractModel):
     ):
         """ Check convergence and compute error of contact traction variable"""
 
-        contact_dof = np.array([], dtype=np.int)
-        for e, _ in self.gb.edges():
-            _, g_h = self.gb.nodes_of_edge(e)
-            if g_h.dim == self.Nd:
-                contact_dof = np.hstack(
-                    (
-                        contact_dof,
-                        self.assembler.dof_ind(e[1], self.contact_traction_variable),
-                    )
-                )
+        contact_dof = self.dof_layout.dofs(
+            self.contact_traction_variable, dim=self.Nd - 1
+        )
 
         # IS POREPY TRACTION WEIGHED ???
         ls = self.params.length_scale
@@ -506,13 +501,71 @@ class Mechanics(CommonAbstractModel):
         Discretize time-dependent quantities etc.
         """
         self.set_mechanics_parameters()
+        self._friction_discretization = {}
 
     def before_newton_iteration(self) -> None:
+        super().before_newton_iteration()
         # Re-discretize the nonlinear term
+        self.rediscretize_friction()
+
+    def rediscretize_friction(self) -> None:
+        """Re-discretize the friction coupling term
+
+        If params.friction_reuse_tolerance is set, the discretization of an interface
+        is reused if the contact state of the fracture was unchanged by its last
+        discretization, and the contact traction has changed by less than the
+        relative tolerance since then. The discretizations are reset in each time
+        step, see before_newton_loop.
+        """
+        tol = self.params.friction_reuse_tolerance
+        if tol is None:
+            term_filter = pp.assembler_filters.ListFilter(
+                term_list=[self.friction_coupling_term]
+            )
+            self.rediscretize(term_filter)
+            return
+
+        couplings, fracs, num_interfaces = [], [], 0
+        for e, _ in self.gb.edges():
+            g_l, g_h = self.gb.nodes_of_edge(e)
+            if g_h.dim != self.Nd:
+                continue
+            num_interfaces += 1
+            if not self._reuse_friction_discretization(g_l, tol):
+                couplings.append((g_h, g_l, e))
+                fracs.append(g_l)
+
+        logger.info(
+            f"Reuse the friction discretization on "
+            f"{num_interfaces - len(couplings)} of {num_interfaces} interfaces"
+        )
+        if not couplings:
+            return
         term_filter = pp.assembler_filters.ListFilter(
-            term_list=[self.friction_coupling_term]
+            grid_list=couplings, term_list=[self.friction_coupling_term]
         )
-        self.assembler.discretize(term_filter)
+        self.rediscretize(term_filter)
+
+        for g in fracs:
+            iterate = self.gb.node_props(g)[pp.STATE][pp.ITERATE]
+            contact_state = self.fracture_contact_state(g)
+            previous = self._friction_discretization.get(g)
+            unchanged = previous is not None and np.array_equal(
+                previous[1], contact_state
+            )
+            traction = iterate[self.contact_traction_variable].copy()
+            self._friction_discretization[g] = (traction, contact_state, unchanged)
+
+    def _reuse_friction_discretization(self, g: pp.Grid, tol: float) -> bool:
+        """ Whether the friction discretization of a fracture can be reused"""
+        if g not in self._friction_discretization:
+            return False
+        traction, _, unchanged = self._friction_discretization[g]
+        if not unchanged:
+            return False
+        iterate = self.gb.node_props(g)[pp.STATE][pp.ITERATE]
+        change = np.linalg.norm(iterate[self.contact_traction_variable] - traction)
+        return change <= tol * np.linalg.norm(traction)
 
     def update_state(self, solution_vector: np.ndarray) -> None:
         """Update variables for the current Newton iteration.
@@ -524,6 +577,8 @@ class Mechanics(CommonAbstractModel):
             - mortar displacements
             - contact traction
         Method is a tailored copy from assembler.distribute_variable.
+        If the iterate is backed by a buffer (see bind_state_buffers), the
+        buffer is updated at the dofs of these variables.
 
         Parameters:
             solution_vector : np.ndarray
@@ -533,31 +588,26 @@ class Mechanics(CommonAbstractModel):
         var_mortar = self.mortar_displacement_variable
         var_contact = self.contact_traction_variable
 
-        assembler = self.assembler
-        variable_names = []
-        for pair in assembler.block_dof.keys():
-            variable_names.append(pair[1])
-
-        dof = np.cumsum(np.append(0, np.asarray(assembler.full_dof)))
-
-        for var_name in set(variable_names):
-            for pair, bi in assembler.block_dof.items():
-                g, name = pair
-                if name != var_name:
-                    continue
-                if isinstance(g, tuple):
-                    # This is really an edge
-                    if name == var_mortar:
-                        mortar_u = (solution_vector[dof[bi] : dof[bi + 1]]).copy()
-                        data = self.gb.edge_props(g)
-                        data[pp.STATE][pp.ITERATE][var_mortar] = mortar_u
-                else:
-                    # g is a node/grid (not edge)
-                    # For the fractures, update the contact force
-                    if (g.dim < self.Nd) and (name == var_contact):
-                        contact = (solution_vector[dof[bi] : dof[bi + 1]]).copy()
-                        data = self.gb.node_props(g)
-                        data[pp.STATE][pp.ITERATE][var_contact] = contact
+        layout = self.dof_layout
+        if self._iterate_buffer is not None:
+            self._ensure_state_buffers()
+            for dofs in [
+                layout.dofs(var_mortar),
+                layout.dofs(var_contact, dim=self.Nd - 1),
+            ]:
+                self._iterate_buffer[dofs] = solution_vector[dofs]
+            return
+
+        for e, dofs in layout.blocks(var_mortar):
+            mortar_u = solution_vector[dofs].copy()
+            data = self.gb.edge_props(e)
+            data[pp.STATE][pp.ITERATE][var_mortar] = mortar_u
+
+        # For the fractures, update the contact force
+        for g, dofs in layout.blocks(var_contact, dim=self.Nd - 1):
+            contact = solution_vector[dofs].copy()
+            data = self.gb.node_props(g)
+            data[pp.STATE][pp.ITERATE][var_contact] = contact
 
     def _is_nonlinear_problem(self) -> bool:
         """
@@ -566,6 +616,24 @@ class Mechanics(CommonAbstractModel):
         """
         return self.gb.dim_min() < self.Nd
 
+    def contact_state(self) -> np.ndarray:
+        """Classification of the fracture cells in the current iterate
+
+        Returns 0 for open, 1 for sticking and 2 for sliding cells, for all
+        fractures. The classification is set by the contact discretization.
+        """
+        states = [
+            self.fracture_contact_state(g) for g, _ in self.gb if g.dim == self.Nd - 1
+        ]
+        return np.hstack(states) if states else np.zeros(0, dtype=int)
+
+    def fracture_contact_state(self, g: pp.Grid) -> np.ndarray:
+        """ Classification of the cells of one fracture, see contact_state()"""
+        iterate = self.gb.node_props(g)[pp.STATE][pp.ITERATE]
+        penetration = iterate.get("penetration", np.zeros(g.num_cells, dtype=bool))
+        sliding = iterate.get("sliding", np.zeros(g.num_cells, dtype=bool))
+        return penetration.astype(int) + np.logical_and(penetration, sliding)
+
     # --- Helper methods ---
 
     def reconstruct_stress(self, previous_iterate: bool = False) -> None:
@@ -644,24 +712,14 @@ class Mechanics(CommonAbstractModel):
         var_mortar = self.mortar_displacement_variable
         nd = self.Nd
 
-        mg: pp.MortarGrid = data_edge["mortar_grid"]
         if from_iterate:
             mortar_u = data_edge[pp.STATE][pp.ITERATE][var_mortar]
         else:
             mortar_u = data_edge[pp.STATE][var_mortar]
 
-        displacement_jump_global_coord = (
-            mg.mortar_to_secondary_avg(nd=nd)
-            * mg.sign_of_mortar_sides(nd=nd)
-            * mortar_u
-        )
-        projection: pp.TangentialNormalProjection = data_edge[
-            "tangential_normal_projection"
-        ]
-
         # Rotated displacement jumps. these are in the local coordinates, on the fracture.
-        project_to_local = projection.project_tangential_normal(int(mg.num_cells / 2))
-        u_mortar_local = project_to_local * displacement_jump_global_coord
+        jump_local = mortar_projection(data_edge, "jump_local")
+        u_mortar_local = jump_local * mortar_u
         return u_mortar_local.reshape((nd, -1), order="F")
 
     # --- Exporting and visualization ---
@@ -780,12 +838,9 @@ class Mechanics(CommonAbstractModel):
             elif g.dim == nd - 1:
                 # Save fracture displacements in global coordinates
                 data_edge = gb.edge_props((g, self._nd_grid()))
-                mg = data_edge["mortar_grid"]
                 mortar_u = data_edge[pp.STATE][var_mortar]
                 displacement_jump_global_coord = (
-                    mg.mortar_to_secondary_avg(nd=nd)
-                    * mg.sign_of_mortar_sides(nd=nd)
-                    * mortar_u
+                    mortar_projection(data_edge, "jump_global") * mortar_u
                 )
                 u_mortar_global = displacement_jump_global_coord.reshape(
                     (nd, -1),
@@ -0,0 +1,196 @@
+""" Composite projection operators on the interfaces of a grid bucket"""
+import logging
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import scipy.sparse as sps
+
+import porepy as pp
+
+logger = logging.getLogger(__name__)
+
+# Key of the operator registry in the edge data
+MORTAR_PROJECTIONS = "mortar_projections"
+
+
+def _jump_global(data_edge: Dict, g_h: Optional[pp.Grid]) -> sps.spmatrix:
+    """ Mortar displacements to displacement jump on the secondary cells"""
+    mg: pp.MortarGrid = data_edge["mortar_grid"]
+    nd = mg.dim + 1
+    return mg.mortar_to_secondary_avg(nd=nd) * mg.sign_of_mortar_sides(nd=nd)
+
+
+def _jump_local(data_edge: Dict, g_h: Optional[pp.Grid]) -> sps.spmatrix:
+    """Mortar displacements to displacement jump in local (tangential, normal)
+    coordinates on the secondary cells. Requires the tangential-normal projection,
+    see pp.contact_conditions.set_projections.
+    """
+    mg: pp.MortarGrid = data_edge["mortar_grid"]
+    projection: pp.TangentialNormalProjection = data_edge[
+        "tangential_normal_projection"
+    ]
+    project_to_local = projection.project_tangential_normal(int(mg.num_cells / 2))
+    return project_to_local * mortar_projection(data_edge, "jump_global")
+
+
+def _primary_cell_to_mortar(data_edge: Dict, g_h: pp.Grid) -> sps.spmatrix:
+    """ Primary cell values to the mortar cells, through the primary faces"""
+    mg: pp.MortarGrid = data_edge["mortar_grid"]
+    return mg.primary_to_mortar_int() * abs(g_h.cell_faces)
+
+
+def _primary_cell_to_secondary_cell(data_edge: Dict, g_h: pp.Grid) -> sps.spmatrix:
+    """ Primary cell values to the secondary cells, summed over the mortar sides"""
+    mg: pp.MortarGrid = data_edge["mortar_grid"]
+    return mg.mortar_to_secondary_int() * mortar_projection(
+        data_edge, "primary_cell_to_mortar", g_h
+    )
+
+
+def _secondary_cell_to_primary_cell(data_edge: Dict, g_h: pp.Grid) -> sps.spmatrix:
+    """ Secondary cell values to the primary cells on both sides, unsigned"""
+    mg: pp.MortarGrid = data_edge["mortar_grid"]
+    secondary_to_primary_face = (
+        mg.mortar_to_primary_int() * mg.secondary_to_mortar_int()
+    )
+    return abs(g_h.cell_faces.T * secondary_to_primary_face)
+
+
+_BUILDERS: Dict[str, Callable[[Dict, Optional[pp.Grid]], sps.spmatrix]] = {
+    "jump_global": _jump_global,
+    "jump_local": _jump_local,
+    "primary_cell_to_mortar": _primary_cell_to_mortar,
+    "primary_cell_to_secondary_cell": _primary_cell_to_secondary_cell,
+    "secondary_cell_to_primary_cell": _secondary_cell_to_primary_cell,
+}
+
+
+def mortar_projection(
+    data_edge: Dict, name: str, g_h: Optional[pp.Grid] = None
+) -> sps.csr_matrix:
+    """Fetch a composite projection operator of an interface
+
+    The operator is assembled on first use, and stored by name in the edge data.
+    Note that the operators are not updated if the mortar grid, or the
+    tangential-normal projection, of the interface is changed.
+
+    Parameters
+    ----------
+    data_edge : Dict
+        edge data of the interface
+    name : str
+        name of the operator. Either of
+            "jump_global": mortar displacements to displacement jumps.
+            "jump_local": mortar displacements to local displacement jumps.
+            "primary_cell_to_mortar": primary cells to mortar cells.
+            "primary_cell_to_secondary_cell": primary cells to secondary cells.
+            "secondary_cell_to_primary_cell": secondary cells to primary cells.
+    g_h : pp.Grid, Optional
+        primary grid of the interface. Required for operators on primary cells.
+
+    Returns
+    -------
+    sps.csr_matrix
+        projection operator
+    """
+    projections: Dict = data_edge.setdefault(MORTAR_PROJECTIONS, {})
+    if name not in projections:
+        if name not in _BUILDERS:
+            raise ValueError(f"Unknown mortar projection: {name}")
+        if g_h is None and not name.startswith("jump"):
+            raise ValueError(f"The primary grid is needed to build {name}")
+        projections[name] = sps.csr_matrix(_BUILDERS[name](data_edge, g_h))
+    return projections[name]
+
+
+def assemble_mortar_projections(gb: pp.GridBucket) -> None:
+    """Assemble the projection operators of all interfaces of a grid bucket
+
+    Use after grid creation, and after setting the tangential-normal projections,
+    to avoid assembly during the simulation.
+    """
+    nd = gb.dim_max()
+    for e, d in gb.edges():
+        g_l, g_h = gb.nodes_of_edge(e)
+        if g_h.dim == nd:
+            mortar_projection(d, "jump_local")
+            mortar_projection(d, "secondary_cell_to_primary_cell", g_h)
+        else:
+            mortar_projection(d, "primary_cell_to_mortar", g_h)
+            mortar_projection(d, "primary_cell_to_secondary_cell", g_h)
+    logger.info(f"Assembled mortar projections on {gb.num_graph_edges()} interfaces")
+
+
+class IntersectionProjection:
+    """Projection of fracture cell values to the sides of all intersection cells
+
+    The fracture cell values of all fractures, concatenated in the order of
+    gb.grids_of_dimension(Nd - 1), are mapped to the mortar cells of all
+    fracture-intersection interfaces by one stacked operator. The rows are sorted
+    by intersection cell, such that reductions over the sides of each
+    intersection cell are segmented reductions.
+    """
+
+    def __init__(self, gb: pp.GridBucket):
+        self.gb = gb
+        nd = gb.dim_max()
+        fractures = gb.grids_of_dimension(nd - 1)
+        self.intersections = gb.grids_of_dimension(nd - 2)
+
+        frac_offsets = np.cumsum([0] + [g.num_cells for g in fractures])
+        self.intersection_offsets = np.cumsum(
+            [0] + [g.num_cells for g in self.intersections]
+        )
+        frac_index = {g: i for i, g in enumerate(fractures)}
+        self.intersection_index = {g: i for i, g in enumerate(self.intersections)}
+
+        blocks, cells = [], []
+        for g, offset in zip(self.intersections, self.intersection_offsets):
+            for g_h in gb.node_neighbors(g, only_higher=True):
+                projection = mortar_projection(
+                    gb.edge_props((g, g_h)), "primary_cell_to_mortar", g_h
+                ).tocoo()
+                cols = projection.col + frac_offsets[frac_index[g_h]]
+                blocks.append(
+                    sps.coo_matrix(
+                        (projection.data, (projection.row, cols)),
+                        shape=(projection.shape[0], frac_offsets[-1]),
+                    )
+                )
+                # The mortar cells are ordered by side, then by intersection cell
+                cells.append(offset + np.arange(projection.shape[0]) % g.num_cells)
+
+        if not blocks:
+            self.projection = sps.csr_matrix((0, frac_offsets[-1]))
+            self.segments = np.zeros(0, dtype=int)
+            return
+
+        cells = np.concatenate(cells)
+        order = np.argsort(cells, kind="stable")
+        self.projection = sps.vstack(blocks).tocsr()[order]
+        # First row of each intersection cell
+        self.segments = np.searchsorted(
+            cells[order], np.arange(self.intersection_offsets[-1])
+        )
+
+    def max(self, fracture_values: np.ndarray) -> np.ndarray:
+        """Maximum over the sides of each intersection cell
+
+        Parameters
+        ----------
+        fracture_values : np.ndarray
+            concatenated cell values of all fractures
+
+        Returns
+        -------
+        np.ndarray
+            concatenated cell values of all intersections
+        """
+        if self.segments.size == 0:
+            return np.zeros(0)
+        return np.maximum.reduceat(self.projection * fracture_values, self.segments)
+
+    def restrict(self, values: np.ndarray, g: pp.Grid) -> np.ndarray:
+        """ Restrict concatenated intersection cell values to one intersection"""
+        i = self.intersection_index[g]
+        return values[self.intersection_offsets[i] : self.intersection_offsets[i + 1]]
@@ -3,6 +3,7 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
+from pypardiso.pardiso_wrapper import PyPardisoError
 
 from GTS import (
     BiotParameters,
@@ -10,6 +11,7 @@ from GTS import (
     ISCBiotContactMechanics,
     stress_tensor,
 )
+from GTS.isc_modelling.linear_solver import condition_number_estimate
 
 
 def best_cond_numb(
@@ -30,22 +32,27 @@ def best_cond_numb(
     length_scales = np.array((1 / 4, 1 / 2, 1, 2, 4)) * ls_0
     log_scalar_scales = np.array((-2, -1, 0, 1, 2)) + log_ss_0
 
-    results = pd.DataFrame(columns=["ls", "log_ss", "cond_pp", "cond_umfpack"])
+    results = pd.DataFrame(
+        columns=["ls", "log_ss", "cond_pp", "cond_umfpack", "cond_1"]
+    )
     for ls in length_scales:
         for log_ss in log_scalar_scales:
             A = assemble_A_method(np.array([ls, log_ss]))
             try:
                 cond_pp = condition_number_porepy(A)
                 cond_umfpack = condition_number_umfpack(A)
-            except ValueError as e:
+                cond_1 = condition_number_estimate(A)["cond_1"]
+            except (ValueError, PyPardisoError) as e:
                 cond_pp = np.nan
                 cond_umfpack = np.nan
+                cond_1 = np.nan
                 print(e)
             v = {
                 "ls": ls,
                 "log_ss": log_ss,
                 "cond_pp": cond_pp,
                 "cond_umfpack": cond_umfpack,
+                "cond_1": cond_1,
             }
             results = results.append(v, ignore_index=True)
 
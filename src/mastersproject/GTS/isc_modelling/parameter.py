@@ -11,6 +11,7 @@ import numpy as np
 import pendulum
 import porepy as pp
 from GTS import ISCData
+from GTS.isc_modelling.mortar_projections import mortar_projection
 from GTS.time_protocols import InjectionRateProtocol
 from pydantic import BaseModel, validator
 
@@ -179,8 +180,19 @@ class BaseParameters(BaseModel):
         Determine the folder to store all results
     viz_file_name : Path
         base file name of all visualization files (.vtu, .pvd)
-    solver : str
-        name of linear solver
+    linear_solver : str
+        name of linear solver. "direct", "amg" for flow models, or
+        "gmres_fixed_stress" for Biot models
+    equilibration : str, Optional
+        row and column scaling of the system for the direct solver, see
+        PardisoSolver.equilibrate(). Alternative to tuning length_scale and
+        scalar_scale for conditioning.
+    incremental_assembly : bool
+        assemble the terms that are unchanged within a time step once per time
+        step, see IncrementalAssembler. Only used by models that define these terms.
+    discretization_threads : int
+        number of threads for the re-discretization in the Newton iterations,
+        see DiscretizationScheduler.
     time, time_step, end_time : float
         time stepping
     """
@@ -199,6 +211,17 @@ class BaseParameters(BaseModel):
 
     # Linear solver
     linear_solver: str = "direct"
+    # Equilibration of the linear system for the direct solver: "ruiz" or "block"
+    equilibration: Optional[str] = None
+    # Log a condition number estimate for every solve with the direct solver
+    estimate_condition_number: bool = False
+    # Assemble the terms that are unchanged within a time step once per time step,
+    # see IncrementalAssembler
+    incremental_assembly: bool = False
+
+    # Discretization
+    # Threads for the re-discretization in the Newton iterations. Serial if 1.
+    discretization_threads: int = 1
 
     # Time-stepping
     time: float = 0
@@ -298,6 +321,14 @@ class MechanicsParameters(GeometryParameters):
     dilation_angle: float = 0
     # Cohesion (for numerical stability)
     cohesion: float = 0.0
+    # Eliminate the contact traction before the linear solve (static condensation).
+    # Not supported with equilibration = "block".
+    condense_contact_traction: bool = False
+    # Reuse the friction discretization of a fracture while its contact state is
+    # unchanged and the relative change of the contact traction is below this value.
+    # If None, the friction term is re-discretized in every Newton iteration.
+    # See Mechanics.rediscretize_friction()
+    friction_reuse_tolerance: Optional[float] = None
 
     # Parameters for Newton solver
     newton_options = {
@@ -428,6 +459,12 @@ class BiotParameters(FlowParameters, MechanicsParameters):
     # Selvadurai (2019): Biot aritcle --> Table 9., on Pahl et. al (1989), mean of aL, aU.
     alpha: float = 0.54
 
+    # Re-discretize the diffusion term only near cells where the permeability changed
+    # by more than this relative tolerance since the last discretization.
+    # If None, all grids are re-discretized in every Newton iteration.
+    # See ISCBiotContactMechanics.rediscretize_diffusion()
+    rediscretization_tolerance: Optional[float] = None
+
 
 # --- Flow injection cell taggers ---
 
@@ -505,12 +542,10 @@ def nd_sides_shearzone_injection_cell(
     # Second, map the cell to the Nd grid
     nd_grid: pp.Grid = gb.grids_of_dimension(gb.dim_max())[0]
     data_edge = gb.edge_props((fracture, nd_grid))
-    mg: pp.MortarGrid = data_edge["mortar_grid"]
-
-    slave_to_master_face = mg.mortar_to_primary_int() * mg.secondary_to_mortar_int()
-    face_to_cell = nd_grid.cell_faces.T
-    slave_to_master_cell = face_to_cell * slave_to_master_face
-    nd_tags = np.abs(slave_to_master_cell) * tags
+    slave_to_master_cell = mortar_projection(
+        data_edge, "secondary_cell_to_primary_cell", nd_grid
+    )
+    nd_tags = slave_to_master_cell * tags
 
     # Set tags on the nd-grid
     nd_grid.tags["well_cells"] = nd_tags
@@ -283,6 +283,78 @@ class TestFlowISC:
         )
         _helper_run_flowisc_optimized_grid(params)
 
+    def test_solve_many_injection_rates(self, mocker):
+        """ Batched solves for several injection rates match separate solves"""
+        setup = _unit_domain_flow_isc("TestFlowISC/test_solve_many_injection_rates")
+        setup.prepare_simulation()
+        setup.before_newton_loop()
+
+        rates = [0, 1 / 6, 1]
+        assemble = mocker.spy(setup, "assemble_matrix_rhs")
+        rhs = setup.injection_rate_rhs(rates)
+        assert assemble.call_count == 1
+
+        solutions = setup.solve_many(rhs)
+        assert solutions.shape == (setup.dof_layout.num_dofs, len(rates))
+
+        for i, rate in enumerate(rates):
+            mocker.patch.object(
+                FlowISC,
+                "source_flow_rate",
+                new_callable=mocker.PropertyMock,
+                return_value=setup.scale_injection_rate(rate),
+            )
+            setup.set_scalar_time_step_parameters()
+            x = setup.assemble_and_solve_linear_system(tol=1e-10)
+            error = np.linalg.norm(solutions[:, i] - x)
+            assert error <= 1e-8 * np.linalg.norm(solutions)
+
+    def test_static_parameters_set_once(self, mocker):
+        """ Time steps refresh the sources, but not the boundary conditions"""
+        setup = _unit_domain_flow_isc("TestFlowISC/test_static_parameters_set_once")
+        setup.prepare_simulation()
+        assert not setup.stale_parameters
+
+        bc_type = mocker.spy(setup, "bc_type_scalar")
+        bc_values = mocker.spy(setup, "bc_values_scalar")
+        source = mocker.spy(setup, "source_scalar")
+        for _ in range(2):
+            setup.time += setup.time_step
+            setup.before_newton_loop()
+
+        bc_type.assert_not_called()
+        bc_values.assert_not_called()
+        assert source.call_count == 2 * setup.gb.num_graph_nodes()
+        assert not setup.stale_parameters
+
+
+def _unit_domain_flow_isc(head: str) -> FlowISC:
+    """ FlowISC on a coarse unit domain with one fracture"""
+    sz = 0.3
+    params = FlowParameters(
+        head=head,
+        time_step=pp.MINUTE,
+        end_time=pp.MINUTE,
+        shearzone_names=["f1"],
+        mesh_args={
+            "mesh_size_frac": sz,
+            "mesh_size_min": sz,
+            "mesh_size_bound": sz * 4,
+        },
+        source_scalar_borehole_shearzone=None,
+        well_cells=nd_injection_cell_center,
+        injection_rate=1,
+        frac_permeability=1,
+        intact_permeability=1,
+        bounding_box={"xmin": 0, "ymin": 0, "zmin": 0, "xmax": 1, "ymax": 1, "zmax": 1},
+    )
+    setup = FlowISC(params)
+    network = network_n_fractures(params.n_frac)
+    setup.gb = network.mesh(
+        mesh_args=params.mesh_args,
+        file_name=str(params.folder_name / "gmsh_frac_file"),
+    )
+    return setup
 
 def _helper_run_flowisc_optimized_grid(
     params: FlowParameters, optimize_method="Netgen"
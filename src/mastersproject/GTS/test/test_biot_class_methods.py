@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 import numpy as np
 
@@ -407,7 +408,7 @@ class BiotReduceToFlow(ContactMechanicsBiotISC):
         all_bf, *_ = self.domain_boundary_sides(g)
         return pp.BoundaryCondition(g, all_bf, ["dir"] * all_bf.size)
 
-    def source_scalar(self, g: pp.Grid) -> np.array:
+    def source_scalar(self, g: pp.Grid, flow_rate: Optional[float] = None) -> np.array:
         return np.zeros(g.num_cells)
 
     def source_mechanics(self, g) -> np.array:
@@ -26,7 +26,8 @@ def structured_grid_2_intx_fracs():
     return gb
 
 
-def test_aperture_of_fracture_intersection():
+def _intersecting_fractures_setup() -> ISCBiotContactMechanics:
+    """ Setup on two intersecting fractures, with initial conditions set"""
     here = Path(__file__).parent / "simulations"
 
     options = {
@@ -48,6 +49,11 @@ def test_aperture_of_fracture_intersection():
     setup._prepare_grid()
     setup.set_biot_parameters()
     setup.initial_biot_condition()
+    return setup
+
+
+def test_aperture_of_fracture_intersection():
+    setup = _intersecting_fractures_setup()
 
     # Set an aperture on the mortar grids
     gb = setup.gb
@@ -69,3 +75,38 @@ def test_aperture_of_fracture_intersection():
         "Disregarding shear, we expected the max jump to be 2 * 5, "
         "where 5 is each side of the u11 displacement"
     )
+
+
+def test_aperture_cache():
+    """ Apertures are cached until the iterate is updated"""
+    setup = _intersecting_fractures_setup()
+    gb = setup.gb
+    s11 = setup.grids_by_name("S1_1")[0]
+    de11 = gb.edge_props((s11, setup._nd_grid()))
+
+    aperture = setup.aperture(s11, scaled=True)
+    assert setup.aperture(s11, scaled=True) is aperture
+    assert not aperture.flags.writeable
+
+    # Open the fracture in the iterate
+    mg11 = de11["mortar_grid"]
+    sgn11 = mg11.sign_of_mortar_sides(3)
+    de11[pp.STATE][pp.ITERATE]["mortar_u"] = sgn11 * np.ones_like(
+        de11[pp.STATE][pp.ITERATE]["mortar_u"]
+    )
+    assert np.allclose(setup.aperture(s11, scaled=True), aperture)
+
+    setup.clear_aperture_cache()
+    assert np.all(setup.aperture(s11, scaled=True) > aperture)
+
+
+def test_initial_aperture_is_stored():
+    """ The initial aperture is computed once, and scaled on request"""
+    setup = _intersecting_fractures_setup()
+    ls = setup.params.length_scale
+    for g, d in setup.gb:
+        assert "initial_aperture" in d
+        unscaled = setup.compute_initial_aperture(g, scaled=False)
+        assert np.allclose(unscaled, d["initial_aperture"])
+        scaled = setup.compute_initial_aperture(g, scaled=True)
+        assert np.allclose(scaled, unscaled * pp.METER / ls)
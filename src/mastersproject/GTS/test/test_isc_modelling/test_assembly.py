@@ -0,0 +1,51 @@
+import numpy as np
+import scipy.sparse as sps
+
+from GTS.isc_modelling.assembly import IncrementalAssembler
+
+
+class _Assembler:
+    """ Fake assembler of a static and a dynamic part"""
+
+    def __init__(self, incremental: IncrementalAssembler):
+        self.incremental = incremental
+        self.static = sps.csr_matrix(np.array([[2.0, -1, 0], [-1, 2, -1], [0, -1, 2]]))
+        self.dynamic = sps.csr_matrix(np.array([[0, 0, 1.0], [0, 1, 0], [0, 0, 0]]))
+        self.b_static, self.b_dynamic = np.ones(3), np.arange(3.0)
+
+    def assemble_matrix_rhs(self, filt, matrix_format):
+        if filt is self.incremental.static_filter:
+            return self.static.copy(), self.b_static.copy()
+        assert filt is self.incremental.dynamic_filter
+        return self.dynamic.copy(), self.b_dynamic.copy()
+
+
+def test_incremental_assembly():
+    incremental = IncrementalAssembler(["mpsa"])
+    assembler = _Assembler(incremental)
+
+    A, b = incremental.assemble(assembler)
+    assert np.allclose(A.toarray(), (assembler.static + assembler.dynamic).toarray())
+    assert np.allclose(b, assembler.b_static + assembler.b_dynamic)
+
+    # New dynamic values on the same pattern are written in place
+    assembler.dynamic = 3 * assembler.dynamic
+    A2, b2 = incremental.assemble(assembler)
+    assert A2 is A
+    assert np.allclose(A2.toarray(), (assembler.static + assembler.dynamic).toarray())
+    assert incremental.num_static_assemblies == 1
+    assert incremental.num_pattern_builds == 1
+
+    # Dynamic entries outside the pattern trigger a rebuild
+    assembler.dynamic = sps.csr_matrix(np.array([[0, 0, 0], [0, 0, 0], [4.0, 0, 0]]))
+    A3, _ = incremental.assemble(assembler)
+    assert np.allclose(A3.toarray(), (assembler.static + assembler.dynamic).toarray())
+    assert incremental.num_pattern_builds == 2
+
+    # The static terms are reassembled after invalidation
+    incremental.invalidate()
+    assembler.static = 2 * assembler.static
+    A4, _ = incremental.assemble(assembler)
+    assert np.allclose(A4.toarray(), (assembler.static + assembler.dynamic).toarray())
+    assert incremental.num_static_assemblies == 2
+    assert incremental.num_pattern_builds == 2
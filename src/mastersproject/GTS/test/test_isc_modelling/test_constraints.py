@@ -0,0 +1,57 @@
+import numpy as np
+import scipy.sparse as sps
+
+from GTS.isc_modelling.constraints import DofConstraint
+
+
+def _system():
+    A = sps.diags([-1, 4, -1], [-1, 0, 1], shape=(5, 5), format="csr")
+    b = np.arange(1.0, 6.0)
+    return A, b
+
+
+def test_apply_in_place():
+    A, b = _system()
+    constraint = DofConstraint(np.array([3, 1]), 5)
+
+    A_c, b_c = constraint.apply(A, b, 2.0)
+    assert A_c is A
+    assert np.allclose(A_c.toarray()[[1, 3]], np.eye(5)[[1, 3]])
+    x = sps.linalg.spsolve(A_c, b_c)
+    assert np.allclose(x[[1, 3]], 2)
+
+    # The positions are reused for a new matrix with the same pattern
+    A2 = A.copy()
+    A2.data[:] = 7
+    A2_c, _ = constraint.apply(A2, b.copy(), 2.0)
+    assert A2_c.nnz == A.nnz
+    assert np.allclose(A2_c.toarray()[1], np.eye(5)[1])
+
+
+def test_apply_adds_missing_diagonal():
+    A = sps.csr_matrix(np.array([[2.0, 1, 0], [1, 0, 1], [0, 1, 2]]))
+    A.eliminate_zeros()
+    constraint = DofConstraint(np.array([1]), 3)
+
+    A_c, b_c = constraint.apply(A, np.ones(3), 5.0)
+    assert np.allclose(A_c.toarray()[1], [0, 1, 0])
+    assert b_c[1] == 5
+
+    # The augmented pattern is built once, and refilled for new values
+    A2 = A.copy()
+    A2.data *= 3
+    A2_c, _ = constraint.apply(A2, np.ones(3), 5.0)
+    assert A2_c is A_c
+    assert np.allclose(A2_c.toarray(), [[6, 3, 0], [0, 1, 0], [0, 3, 6]])
+
+
+def test_eliminate_and_prolong():
+    A, b = _system()
+    constraint = DofConstraint(np.array([1, 3]), 5)
+    values = np.array([2.0, -1.0])
+
+    A_f, b_f = constraint.eliminate(A, b, values)
+    x = constraint.prolong(sps.linalg.spsolve(A_f, b_f), values)
+
+    A_c, b_c = constraint.apply(A.copy(), b.copy(), values)
+    assert np.allclose(x, sps.linalg.spsolve(A_c, b_c))
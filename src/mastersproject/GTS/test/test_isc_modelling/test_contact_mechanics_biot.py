@@ -76,6 +76,86 @@ class TestContactMechanicsBiotBase:
             assert key_m in params
             assert "normal_diffusivity" in params[key_s]
 
+    def test_update_biot_parameters(self, setup):
+        """ Only the stale tiers are refreshed"""
+        setup.update_biot_parameters()
+        assert not setup.stale_parameters
+
+        key_s = setup.scalar_parameter_key
+        key_m = setup.mechanics_parameter_key
+        g = setup._nd_grid()
+        d = setup.gb.node_props(g)
+        bc = d[pp.PARAMETERS][key_m]["bc"]
+
+        setup.time_step = 0.5
+        setup.stale_parameters.add("time_step")
+        setup.update_biot_parameters()
+        assert d[pp.PARAMETERS][key_s]["time_step"] == 0.5
+        assert d[pp.PARAMETERS][key_m]["time_step"] == 0.5
+        # Boundary conditions are static
+        assert d[pp.PARAMETERS][key_m]["bc"] is bc
+
+    def test_bind_state_buffers(self, setup):
+        """ STATE and ITERATE are views into contiguous buffers"""
+        setup.set_biot_parameters()
+        setup.assign_biot_variables()
+        setup.assign_biot_discretizations()
+        setup.initial_biot_condition()
+        setup.assembler = pp.Assembler(setup.gb)
+        state = setup.get_state_vector()
+
+        setup.bind_state_buffers()
+        assert np.allclose(setup.get_state_vector(), state)
+
+        # Updates of the buffers are seen in the grid bucket data
+        solution = np.arange(state.size, dtype=float)
+        setup.update_state(solution)
+        var_m = setup.mortar_displacement_variable
+        e, dofs = setup.dof_layout.blocks(var_m)[0]
+        iterate = setup.gb.edge_props(e)[pp.STATE][pp.ITERATE][var_m]
+        assert np.allclose(iterate, solution[dofs])
+        # Only the mortar displacement and contact traction iterates are updated
+        var_p = setup.scalar_variable
+        g, dofs = setup.dof_layout.blocks(var_p, dim=setup.Nd)[0]
+        iterate = setup.gb.node_props(g)[pp.STATE][pp.ITERATE][var_p]
+        assert np.allclose(iterate, state[dofs])
+
+        setup.assembler.distribute_variable = None  # not used with buffers
+        setup.export_step = lambda: None
+        setup.after_newton_convergence(solution, [], 0)
+        assert np.allclose(setup.get_state_vector(), solution)
+        # The state vector is a copy
+        assert not np.shares_memory(setup.get_state_vector(), setup._state_buffer)
+
+        # Reassigned entries are rebound
+        setup.initial_biot_condition()
+        assert np.allclose(setup.get_state_vector(), state)
+        g_state = setup.gb.node_props(g)[pp.STATE][var_p]
+        assert np.shares_memory(g_state, setup._state_buffer)
+
+    def test_reuse_friction_discretization(self, setup):
+        """ Reuse for a stable contact state and a small traction change"""
+        setup.initial_biot_condition()
+        g = setup.gb.grids_of_dimension(setup.Nd - 1)[0]
+        iterate = setup.gb.node_props(g)[pp.STATE][pp.ITERATE]
+        traction = np.ones(g.num_cells * setup.Nd)
+        iterate[setup.contact_traction_variable] = 1.001 * traction
+        contact_state = np.ones(g.num_cells, dtype=int)
+
+        setup._friction_discretization[g] = (traction, contact_state, True)
+        assert setup._reuse_friction_discretization(g, tol=1e-2)
+        assert not setup._reuse_friction_discretization(g, tol=1e-4)
+
+        # The contact state changed at the last discretization
+        setup._friction_discretization[g] = (traction, contact_state, False)
+        assert not setup._reuse_friction_discretization(g, tol=1e-2)
+
+    def test_initialize_linear_solver_rejects_amg(self, setup):
+        """ AMG is for the flow model only, not the coupled system"""
+        setup.params.linear_solver = "amg"
+        with pytest.raises(ValueError):
+            setup.initialize_linear_solver()
+
     def test_assign_biot_variables(self, setup):
         setup.assign_biot_variables()
 
@@ -0,0 +1,160 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import porepy as pp
+from GTS.isc_modelling.discretization import DiscretizationScheduler, partial_update
+
+
+class _Grid(SimpleNamespace):
+    def __hash__(self):
+        return id(self)
+
+
+class _Discretization:
+    """ Record the discretized terms in the data"""
+
+    def __init__(self, key):
+        self.key = key
+
+    def discretize(self, *args):
+        data = args[-1]
+        data.setdefault("discretized", []).append(self.key)
+
+
+class _PrimaryWriter:
+    """ Coupling discretization which stores a matrix for the primary grid"""
+
+    def discretize(self, g_h, g_l, data_h, data_l, data_edge):
+        data_h.setdefault(pp.DISCRETIZATION_MATRICES, {})["robin"] = {"x": object()}
+
+
+class _TermFilter:
+    """ Pass all terms but "skip" """
+
+    def filter(self, grids=None, variables=None, terms=None):
+        return terms[0] != "skip"
+
+
+class _GridBucket:
+    """ A 3d grid with two fractures"""
+
+    def __init__(self):
+        self.g3, self.g2a, self.g2b = (
+            _Grid(dim=3, num_cells=100),
+            _Grid(dim=2, num_cells=10),
+            _Grid(dim=2, num_cells=20),
+        )
+        self.nodes = {}
+        for g in (self.g3, self.g2a, self.g2b):
+            self.nodes[g] = {
+                pp.DISCRETIZATION: {
+                    "p": {
+                        "flux": _Discretization("flux"),
+                        "skip": _Discretization("skip"),
+                    }
+                }
+            }
+        self.edge_data = {}
+        for g_l in (self.g2a, self.g2b):
+            e = (g_l, self.g3)
+            self.edge_data[e] = {
+                pp.COUPLING_DISCRETIZATION: {
+                    "robin": {
+                        self.g3: ("p", "flux"),
+                        g_l: ("p", "flux"),
+                        e: ("mortar_p", _Discretization("robin")),
+                    }
+                }
+            }
+
+    def __iter__(self):
+        return iter(self.nodes.items())
+
+    def edges(self):
+        return iter(self.edge_data.items())
+
+    def nodes_of_edge(self, e):
+        return e
+
+    def node_props(self, g):
+        return self.nodes[g]
+
+
+def test_discretization_scheduler():
+    gb = _GridBucket()
+    scheduler = DiscretizationScheduler(max_workers=4)
+
+    node_tasks = scheduler.node_tasks(gb, _TermFilter())
+    assert [len(task) for task in node_tasks] == [1, 1, 1]
+
+    scheduler.discretize(gb, _TermFilter())
+    for g, d in gb:
+        assert d["discretized"] == ["flux"]
+    for e, d in gb.edges():
+        assert d["discretized"] == ["robin"]
+
+    # Serial by default
+    assert DiscretizationScheduler().max_workers == 1
+
+
+def test_discretization_scheduler_rejects_writes_to_primary_grid():
+    gb = _GridBucket()
+    for e, d in gb.edges():
+        coupling = d[pp.COUPLING_DISCRETIZATION]["robin"]
+        coupling[e] = ("mortar_p", _PrimaryWriter())
+
+    with pytest.raises(RuntimeError):
+        DiscretizationScheduler(max_workers=2).discretize(gb, _TermFilter())
+    DiscretizationScheduler(max_workers=1).discretize(gb, _TermFilter())
+
+
+def _mpfa_data(g, k):
+    """ Dirichlet on the domain boundary, Neumann on the fracture faces"""
+    boundary = g.get_all_boundary_faces()
+    labels = np.where(g.tags["fracture_faces"][boundary], "neu", "dir")
+    parameters = {
+        "second_order_tensor": pp.SecondOrderTensor(k),
+        "bc": pp.BoundaryCondition(g, boundary, list(labels)),
+        "bc_values": np.zeros(g.num_faces),
+    }
+    return pp.initialize_default_data(g, {}, "flow", parameters)
+
+
+def _assert_partial_update_matches_full_discretization(g, cells):
+    discr = pp.Mpfa("flow")
+    k = np.ones(g.num_cells)
+    d = _mpfa_data(g, k)
+    discr.discretize(g, d)
+
+    k_new = k.copy()
+    k_new[cells] = 100
+    d[pp.PARAMETERS]["flow"]["second_order_tensor"] = pp.SecondOrderTensor(k_new)
+    partial_update(discr, g, d, cells)
+
+    expected = _mpfa_data(g, k_new)
+    discr.discretize(g, expected)
+    for key, matrix in expected[pp.DISCRETIZATION_MATRICES]["flow"].items():
+        updated = d[pp.DISCRETIZATION_MATRICES]["flow"][key]
+        assert np.allclose(updated.toarray(), matrix.toarray())
+
+
+def test_partial_update_matches_full_discretization():
+    g = pp.CartGrid([6, 5])
+    g.compute_geometry()
+    _assert_partial_update_matches_full_discretization(g, np.array([7, 8, 20]))
+
+
+def test_partial_update_next_to_fracture():
+    """ Changed permeability on both sides of a fracture, at its split faces"""
+    fracture = np.array([[1, 5], [2, 2]])
+    gb = pp.meshing.cart_grid([fracture], nx=[6, 5])
+    g = gb.grids_of_dimension(2)[0]
+
+    fracture_faces = np.flatnonzero(g.tags["fracture_faces"])
+    fracture_cells = np.unique(g.cell_faces.tocsr()[fracture_faces].indices)
+    cells = fracture_cells[[0, -1]]
+    # One cell on each side of the fracture
+    assert np.ptp(g.cell_centers[1, cells]) > 0
+    _assert_partial_update_matches_full_discretization(g, cells)
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from GTS.isc_modelling.dof_layout import DofLayout
+
+
+class _Grid(SimpleNamespace):
+    def __hash__(self):
+        return id(self)
+
+
+def _assembler():
+    """ Fake assembler with a 3d grid, a fracture and their interface"""
+    g3, g2 = _Grid(dim=3), _Grid(dim=2)
+    e = (g2, g3)
+    block_dof = {(g3, "p"): 0, (g3, "u"): 1, (g2, "p"): 3, (e, "mortar_u"): 2}
+    full_dof = [4, 12, 6, 2]
+    return (
+        SimpleNamespace(block_dof=block_dof, full_dof=full_dof, num_dof=lambda: 24),
+        g3,
+        g2,
+        e,
+    )
+
+
+def test_dof_layout():
+    assembler, g3, g2, e = _assembler()
+    layout = DofLayout(assembler)
+
+    assert layout.block_keys == [(g3, "p"), (g3, "u"), (e, "mortar_u"), (g2, "p")]
+    assert np.all(layout.block_dofs((e, "mortar_u")) == np.arange(16, 22))
+    assert np.all(layout.dofs("p") == np.hstack((np.arange(4), np.arange(22, 24))))
+    assert np.all(layout.dofs("p", dim=2) == np.arange(22, 24))
+    assert layout.blocks("mortar_u", dim=2) == [(e, slice(16, 22))]
+    assert layout.dofs("p") is layout.dofs("p")
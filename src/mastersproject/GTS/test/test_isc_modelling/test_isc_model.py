@@ -209,6 +209,26 @@ class TestISCBiotContactMechanics:
         setup = ISCBiotContactMechanics(biot_params)
         setup.prepare_simulation()
 
+    def test_seed_discretized_permeability(self, biot_params_small, mocker):
+        """ The first re-discretization is partial, from the initial discretization"""
+        biot_params_small["rediscretization_tolerance"] = 1e-6
+        setup = ISCBiotContactMechanics(BiotParameters(**biot_params_small))
+        setup.prepare_simulation()
+        for g, _ in setup.gb:
+            k = setup._discretized_permeability[g]
+            assert np.allclose(k, setup.diffusion_permeability(g))
+
+        g2 = setup.gb.grids_of_dimension(2)[0]
+        mocker.patch.object(
+            setup,
+            "changed_permeability_cells",
+            side_effect=lambda g, rtol: np.array([0] if g is g2 else [], dtype=int),
+        )
+        update = mocker.patch("GTS.isc_modelling.isc_model.partial_update")
+        setup.rediscretize_diffusion()
+        update.assert_called_once()
+        assert update.call_args[0][1] is g2
+
     def test_run_simulation(self, biot_params):
         setup = ISCBiotContactMechanics(biot_params)
         setup.prepare_simulation()
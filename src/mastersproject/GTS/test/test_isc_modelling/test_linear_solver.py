@@ -0,0 +1,268 @@
+import numpy as np
+import pytest
+import scipy.sparse as sps
+from pypardiso.pardiso_wrapper import PyPardisoError
+
+from GTS.isc_modelling.general_model import CommonAbstractModel
+from GTS.isc_modelling.linear_solver import (
+    AMGSolver,
+    FixedStressGMRES,
+    PardisoSolver,
+    StaticCondensation,
+    condition_number_estimate,
+    ruiz_equilibration,
+)
+
+
+def _random_system(n=40, seed=0):
+    """ Diagonally dominant, non-symmetric sparse system"""
+    rng = np.random.RandomState(seed)
+    A = sps.random(n, n, density=0.1, format="csr", random_state=rng)
+    A = (A + n * sps.eye(n)).tocsr()
+    b = rng.rand(n)
+    return A, b
+
+
+class TestPardisoSolver:
+    def test_reuse_symbolic_factorization(self):
+        """ Same sparsity pattern: analysis is done only once"""
+        A, b = _random_system()
+        solver = PardisoSolver()
+
+        for scale in [1, 2, 5]:
+            A_new = A.copy()
+            A_new.data *= scale
+            x = solver.solve(A_new, b)
+            assert np.allclose(A_new * x, b)
+
+        assert solver.num_analyses == 1
+        assert solver.num_factorizations == 3
+
+    def test_reuse_numerical_factorization(self):
+        """ Identical matrix and key: only the solve phase is done"""
+        A, b = _random_system()
+        solver = PardisoSolver()
+
+        solver.solve(A, b, key=1)
+        x = solver.solve(A.copy(), 2 * b, key=1)
+        assert np.allclose(A * x, 2 * b)
+        assert solver.num_factorizations == 1
+        assert solver.num_reused_factorizations == 1
+
+        # Changed key, e.g. a new time step
+        solver.solve(A, b, key=0.5)
+        assert solver.num_factorizations == 2
+
+    def test_chord_solve(self):
+        """ Chord iterations with the factorization of a nearby matrix converge"""
+        A, b = _random_system()
+        solver = PardisoSolver()
+        solver.solve(A, b)
+
+        A_new = A.copy()
+        A_new.data *= 1.1
+        x = np.zeros_like(b)
+        for _ in range(30):
+            x = solver.chord_solve(A_new, b, x)
+        assert np.allclose(A_new * x, b)
+        assert solver.num_factorizations == 1
+
+    @pytest.mark.parametrize("equilibration", ["ruiz", "block"])
+    def test_equilibration(self, equilibration):
+        """ Solve a system with blocks of very different magnitude"""
+        A, b = _random_system()
+        scaling = np.ones(A.shape[0])
+        scaling[:20] = 1e8
+        A = (sps.diags(scaling) * A * sps.diags(scaling)).tocsr()
+
+        solver = PardisoSolver(equilibration=equilibration)
+        solver.blocks = [np.arange(20), np.arange(20, A.shape[0])]
+        x = solver.solve(A, b)
+        assert np.allclose(A * x, b)
+
+        # Reuse of the factorization also reuses the scaling
+        x = solver.solve(A, 2 * b)
+        assert np.allclose(A * x, 2 * b)
+        assert solver.num_reused_factorizations == 1
+
+    @pytest.mark.parametrize("equilibration", [None, "ruiz"])
+    def test_multiple_right_hand_sides(self, equilibration):
+        """ Factorize once, solve for all right-hand sides in one call"""
+        A, b = _random_system()
+        rhs = np.column_stack([b, 2 * b, np.ones_like(b)])
+
+        solver = PardisoSolver(equilibration=equilibration)
+        solver.factorize(A)
+        x = solver.apply(rhs)
+        assert x.shape == rhs.shape
+        assert np.allclose(A * x, rhs)
+        assert solver.num_factorizations == 1
+
+    def test_residual_growth_after_factorize(self):
+        """ The residual safeguard is active also after an analysis by factorize()"""
+        A, b = _random_system()
+        # Any residual growth triggers a new analysis
+        solver = PardisoSolver(residual_growth=0)
+        solver.factorize(A)
+        assert solver.num_analyses == 1
+
+        # The first solve with the reused analysis sets the reference residual
+        x = solver.solve(2 * A, b)
+        assert np.allclose(2 * A * x, b)
+        assert solver.num_analyses == 1
+
+        A_new = A.copy()
+        A_new.data *= np.linspace(1, 3, A.nnz)
+        x = solver.solve(A_new, b)
+        assert np.allclose(A_new * x, b)
+        assert solver.num_analyses == 2
+
+    def test_new_pattern_triggers_analysis(self):
+        A, b = _random_system()
+        solver = PardisoSolver()
+        solver.solve(A, b)
+
+        A_new, _ = _random_system(seed=1)
+        x = solver.solve(A_new, b)
+        assert np.allclose(A_new * x, b)
+        assert solver.num_analyses == 2
+
+
+class TestFixedStressGMRES:
+    def test_solve_coupled_system(self):
+        """ Solve a two-block system to the GMRES tolerance"""
+        A, b = _random_system(n=60)
+        flow_dofs = np.arange(0, 60, 3)
+        mechanics_dofs = np.setdiff1d(np.arange(60), flow_dofs)
+
+        solver = FixedStressGMRES(tol=1e-10)
+        solver.set_block_structure(
+            flow_dofs, mechanics_dofs, stabilization=np.ones(flow_dofs.size)
+        )
+        x = solver.solve(A, b)
+        assert np.linalg.norm(b - A * x) < 1e-8 * np.linalg.norm(b)
+
+        # Loose solve, tolerance relative to the initial residual
+        x0 = np.zeros_like(b)
+        x = solver.solve(A, b, tol=1e-3, x0=x0)
+        assert np.linalg.norm(b - A * x) <= 1e-3 * np.linalg.norm(b - A * x0)
+
+        # The block factorizations reuse the symbolic factorization
+        assert solver.flow_solver.num_analyses == 1
+        assert solver.mechanics_solver.num_analyses == 1
+
+
+class TestAMGSolver:
+    def test_reuse_hierarchy(self):
+        """ The hierarchy is reused for a new time step, and rebuilt on reset"""
+        pytest.importorskip("pyamg")
+        n = 30
+        # 2d Laplacian plus mass term
+        lap = sps.diags([-1.0, 2.0, -1.0], [-1, 0, 1], shape=(n, n))
+        lap = sps.kronsum(lap, lap).tocsr()
+        A = lap + sps.eye(n * n)
+        b = np.ones(n * n)
+
+        solver = AMGSolver(tol=1e-10)
+        for dt in [1, 0.5]:
+            A_new = (lap * dt + sps.eye(n * n)).tocsr()
+            x = solver.solve(A_new, b)
+            assert np.linalg.norm(b - A_new * x) < 1e-8 * np.linalg.norm(b)
+        assert solver.num_setups == 1
+
+        solver.reset()
+        solver.solve(A, b)
+        assert solver.num_setups == 2
+
+
+class TestStaticCondensation:
+    def test_condense_and_expand(self):
+        """Eliminate 'contact traction' coupled to two-sided 'mortar' unknowns
+
+        Every other contact block is singular, which requires pivoting to the
+        mortar rows.
+        """
+        rng = np.random.RandomState(0)
+        num_cells, k = 5, 3
+        num_mortar, num_other = 2 * num_cells * k, 10
+        n = num_mortar + num_cells * k + num_other
+        traction = np.arange(num_mortar, num_mortar + num_cells * k)
+        other = np.arange(n - num_other, n)
+
+        A = sps.lil_matrix((n, n))
+        for c in range(num_cells):
+            cell_traction = traction[c * k : (c + 1) * k]
+            for side, sign in enumerate([1, -1]):
+                start = side * num_cells * k + c * k
+                mortar = np.arange(start, start + k)
+                A[np.ix_(mortar, mortar)] = rng.rand(k, k) + 5 * np.eye(k)
+                A[np.ix_(mortar, cell_traction)] = sign * np.eye(k)
+                A[np.ix_(cell_traction, mortar)] = rng.rand(k, k)
+            if c % 2 == 0:
+                A[np.ix_(cell_traction, cell_traction)] = np.diag([0, 1, 1])
+            else:
+                A[np.ix_(cell_traction, cell_traction)] = rng.rand(k, k) + np.eye(k)
+        A[np.ix_(other, other)] = 4 * np.eye(num_other)
+        A[np.ix_(other, np.arange(num_mortar))] = 0.1 * rng.rand(num_other, num_mortar)
+        A[np.ix_(np.arange(num_mortar), other)] = 0.1 * rng.rand(num_mortar, num_other)
+        A = A.tocsr()
+        b = rng.rand(n)
+
+        condensation = StaticCondensation(traction, block_size=k)
+        S, b_S = condensation.condense(A, b)
+        assert S.shape == (n - traction.size, n - traction.size)
+
+        x = condensation.expand(PardisoSolver().solve(S, b_S))
+        assert np.allclose(A * x, b)
+
+
+def test_ruiz_equilibration():
+    A, _ = _random_system()
+    A = (sps.diags(np.logspace(-6, 6, A.shape[0])) * A).tocsr()
+    r, c = ruiz_equilibration(A, max_iterations=50)
+    scaled = abs(sps.diags(r) * A * sps.diags(c))
+    assert np.allclose(scaled.max(axis=1).toarray(), 1, atol=1e-2)
+    assert np.allclose(scaled.max(axis=0).toarray(), 1, atol=1e-2)
+
+
+def test_condition_number_estimate():
+    A, b = _random_system()
+    A = (sps.diags(np.logspace(-3, 3, A.shape[0])) * A).tocsr()
+    dense = A.toarray()
+
+    solver = PardisoSolver(equilibration="ruiz")
+    solver.solve(A, b)
+    estimate = condition_number_estimate(A, solver, singular_values=True)
+
+    # The 1-norm estimate is a lower bound, usually sharp
+    cond_1 = np.linalg.cond(dense, 1)
+    assert cond_1 / 3 < estimate["cond_1"] <= cond_1 * (1 + 1e-8)
+    assert np.isclose(estimate["cond_2"], np.linalg.cond(dense, 2))
+
+
+def test_estimate_condition_number_of_model(mocker):
+    """ Reuse the factorization of the model solver, and give nan on failure"""
+    A, b = _random_system()
+    setup = mocker.Mock(time_step=1.0)
+    setup.assemble_matrix_rhs.return_value = (A, b)
+    setup.linear_solver = PardisoSolver()
+    setup.linear_solver.solve(A, b, key=setup.time_step)
+
+    estimate = mocker.patch(
+        "GTS.isc_modelling.general_model.condition_number_estimate",
+        wraps=condition_number_estimate,
+    )
+    # onenormest starts from random vectors
+    np.random.seed(0)
+    cond_1 = CommonAbstractModel.estimate_condition_number(setup)
+    np.random.seed(0)
+    assert np.isclose(cond_1, condition_number_estimate(A)["cond_1"])
+    assert estimate.call_args[0][1] is setup.linear_solver
+
+    # A changed matrix is factorized separately
+    setup.assemble_matrix_rhs.return_value = (2 * A, b)
+    CommonAbstractModel.estimate_condition_number(setup)
+    assert estimate.call_args[0][1] is None
+
+    estimate.side_effect = PyPardisoError(-4)
+    assert np.isnan(CommonAbstractModel.estimate_condition_number(setup))
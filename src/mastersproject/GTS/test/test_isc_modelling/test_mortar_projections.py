@@ -0,0 +1,85 @@
+import numpy as np
+
+import porepy as pp
+from GTS.isc_modelling.mortar_projections import (
+    MORTAR_PROJECTIONS,
+    IntersectionProjection,
+    assemble_mortar_projections,
+    mortar_projection,
+)
+
+
+def _two_intersecting_fractures() -> pp.GridBucket:
+    # fmt: off
+    frac_pts = np.array(
+        [[0, 4, 4, 0],
+         [0, 0, 4, 4],
+         [1, 1, 1, 1]]
+    )
+    frac_pts2 = np.array(
+        [[2, 2, 2, 2],
+         [0, 0, 4, 4],
+         [0, 2, 2, 0]]
+    )
+    # fmt: on
+    gb = pp.meshing.cart_grid([frac_pts, frac_pts2], nx=np.array([4, 4, 4]))
+    pp.contact_conditions.set_projections(gb)
+    return gb
+
+
+def test_mortar_projections_match_operator_chains():
+    gb = _two_intersecting_fractures()
+    assemble_mortar_projections(gb)
+    rng = np.random.RandomState(0)
+
+    for e, d in gb.edges():
+        g_l, g_h = gb.nodes_of_edge(e)
+        mg: pp.MortarGrid = d["mortar_grid"]
+        assert MORTAR_PROJECTIONS in d
+        if g_h.dim == gb.dim_max():
+            nd = g_h.dim
+            u = rng.rand(mg.num_cells * nd)
+            jump = mg.mortar_to_secondary_avg(nd=nd) * mg.sign_of_mortar_sides(nd=nd) * u
+            projection = d["tangential_normal_projection"]
+            local = projection.project_tangential_normal(g_l.num_cells) * jump
+            assert np.allclose(mortar_projection(d, "jump_global") * u, jump)
+            assert np.allclose(mortar_projection(d, "jump_local") * u, local)
+        else:
+            values = rng.rand(g_h.num_cells)
+            expected = (
+                mg.mortar_to_secondary_int()
+                * mg.primary_to_mortar_int()
+                * np.abs(g_h.cell_faces)
+                * values
+            )
+            op = mortar_projection(d, "primary_cell_to_secondary_cell", g_h)
+            assert np.allclose(op * values, expected)
+
+        # The operators are reused
+        assert mortar_projection(d, "jump_global") is mortar_projection(
+            d, "jump_global"
+        )
+
+
+def test_intersection_projection_max():
+    """ Compare with the maximum over the mortar sides of each intersection"""
+    gb = _two_intersecting_fractures()
+    rng = np.random.RandomState(0)
+    fractures = gb.grids_of_dimension(2)
+    frac_values = {g: rng.rand(g.num_cells) for g in fractures}
+
+    projection = IntersectionProjection(gb)
+    values = projection.max(np.concatenate([frac_values[g] for g in fractures]))
+
+    for g in gb.grids_of_dimension(1):
+        mortar_values = [
+            d["mortar_grid"].primary_to_mortar_int()
+            * np.abs(g_h.cell_faces)
+            * frac_values[g_h]
+            for g_h in gb.node_neighbors(g, only_higher=True)
+            for d in [gb.edge_props((g, g_h))]
+        ]
+        expected = np.max(
+            np.vstack([v.reshape((2, -1)) for v in mortar_values]), axis=0
+        )
+        assert np.allclose(projection.restrict(values, g), expected)
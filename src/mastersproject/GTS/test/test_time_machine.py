@@ -2,13 +2,242 @@ from pathlib import Path
 
 import numpy as np
 import pytest
+import scipy.sparse as sps
 
 from GTS import BaseParameters, Flow
-
-from GTS.time_machine import TimeMachinePhasesConstantDt, NewtonParameters, TimeMachine
+from GTS.isc_modelling.general_model import CommonAbstractModel
+from GTS.isc_modelling.linear_solver import PardisoSolver
+from GTS.time_machine import (
+    AndersonAcceleration,
+    EisenstatWalker,
+    NewtonParameters,
+    TimeMachine,
+    TimeMachinePhasesConstantDt,
+)
 from GTS.time_protocols import TimeStepPhase, TimeStepProtocol
 
 
+class CubeRootModel(CommonAbstractModel):
+    """Newton iterations for x^3 = (8, 27), from the state x = (1, 1)
+
+    The Jacobian is "discretized" at the iterate by before_newton_iteration.
+    """
+
+    def __init__(self, params: BaseParameters):
+        super().__init__(params)
+        self.state = np.ones(2)
+        self.iterate = self.state.copy()
+        self.linearization = self.iterate.copy()
+        self.time, self.time_step = 1.0, 1.0
+
+    def prepare_simulation(self):
+        pass
+
+    def before_newton_loop(self):
+        pass
+
+    def before_newton_iteration(self):
+        super().before_newton_iteration()
+        self.linearization = self.iterate.copy()
+
+    def get_state_vector(self):
+        return self.state.copy()
+
+    def update_state(self, solution_vector: np.ndarray) -> None:
+        super().update_state(solution_vector)
+        self.iterate = solution_vector.copy()
+
+    def after_newton_convergence(self, solution, errors, iteration_counter) -> None:
+        self.state = solution.copy()
+
+    def assemble_matrix_rhs(self):
+        x = self.iterate
+        A = sps.diags(3 * self.linearization ** 2).tocsr()
+        b = A * x - (x ** 3 - np.array([8, 27]))
+        return A, b
+
+    def check_convergence(self, solution, prev_solution, init_solution, nl_params):
+        error = np.max(np.abs(solution - prev_solution))
+        converged = error < nl_params["convergence_tol"]
+        return error, converged, error > nl_params["divergence_tol"]
+
+    def initialize_linear_solver(self) -> None:
+        self.linear_solver = PardisoSolver()
+
+    def after_simulation(self):
+        pass
+
+    def set_viz(self):
+        pass
+
+    def export_step(self, write_vtk: bool = True):
+        pass
+
+    def _is_nonlinear_problem(self) -> bool:
+        return True
+
+
+@pytest.fixture
+def cube_root_model(tmp_path) -> CubeRootModel:
+    return CubeRootModel(BaseParameters(folder_name=tmp_path))
+
+
+class TestTimeMachine:
+    def test_reuse_factorization_chord(self):
+        """ Chord steps until contraction degrades or the contact state changes"""
+        time_params = TimeStepProtocol.create_protocol([0, 1], [1])
+        newton = NewtonParameters(chord=True, chord_contraction=0.5)
+        tm = TimeMachine(None, newton, time_params)  # noqa
+        state = np.array([0, 1, 2])
+
+        # Always factorize at the first iteration of a time step
+        assert not tm.reuse_factorization([], state, None)
+        # Fast contraction and unchanged contact state
+        assert tm.reuse_factorization([1, 0.1], state, state)
+        # Slow contraction
+        assert not tm.reuse_factorization([1, 0.9], state, state)
+        # Changed contact state
+        assert not tm.reuse_factorization([1, 0.1], state, np.array([0, 1, 1]))
+
+        # Standard Newton
+        tm.newton_params = NewtonParameters()
+        assert not tm.reuse_factorization([1, 0.1], state, state)
+
+    def test_line_search(self, mocker):
+        """ Halve the step until the residual norm decreases sufficiently"""
+        time_params = TimeStepProtocol.create_protocol([0, 1], [1])
+        newton = NewtonParameters(globalization="line_search")
+        setup = mocker.Mock()
+        # Residual |x - 1|: From x = 0, the full step to x = 3 overshoots
+        setup.nonlinear_residual_norm.side_effect = lambda x: float(abs(x[0] - 1))
+        tm = TimeMachine(setup, newton, time_params)
+
+        x, residual_norm = tm.line_search(np.zeros(1), np.array([3.0]), 1.0)
+        assert np.allclose(x, 1.5)
+        assert np.isclose(residual_norm, 0.5)
+        setup.after_newton_iteration.assert_called_with(x)
+        # Re-discretize at the full step and at the halved step
+        assert setup.before_newton_iteration.call_count == 2
+
+        # A sufficient decrease takes the full step
+        x, _ = tm.line_search(np.zeros(1), np.array([0.9]), 1.0)
+        assert np.allclose(x, 0.9)
+
+        with pytest.raises(ValueError):
+            NewtonParameters(globalization="trust_region")
+
+    def test_damping_with_oscillating_contact_state(self, mocker):
+        """ A damped step below the tolerance converges"""
+        time_params = TimeStepProtocol.create_protocol([0, 1], [1])
+        newton = NewtonParameters(globalization="damping")
+        setup = mocker.Mock(time=1.0)
+        setup.get_state_vector.return_value = np.zeros(2)
+        setup.assemble_and_solve_linear_system.return_value = np.ones(2)
+        # The contact state flips at every iteration, so all but the first are damped
+        states = iter(np.arange(newton.max_iterations) % 2)
+        setup.contact_state.side_effect = lambda: np.array([next(states)])
+        # Converged from the second, damped, iteration
+        setup.check_convergence.side_effect = [(1.0, False, False), (0.0, True, False)]
+        tm = TimeMachine(setup, newton, time_params)
+
+        sol = tm.time_iteration()
+        assert np.allclose(sol, 1)
+        assert setup.check_convergence.call_count == 2
+        setup.after_newton_convergence.assert_called_once()
+        setup.after_newton_failure.assert_not_called()
+
+    def test_predictor(self, mocker):
+        """ Extrapolate pressure and displacement, unless the residual increases"""
+        time_params = TimeStepProtocol.create_protocol([0, 3], [1])
+        newton = NewtonParameters(predictor_order=2)
+        setup = mocker.Mock()
+        setup.scalar_variable, setup.displacement_variable = "p", "u"
+        setup.mortar_displacement_variable = "mortar_u"
+        dofs = {"p": np.array([0]), "u": np.array([1]), "mortar_u": np.array([], int)}
+        setup.dof_layout.dofs.side_effect = dofs.get
+        tm = TimeMachine(setup, newton, time_params)
+
+        # p = u = t^2, and a contact traction (last dof) which is not extrapolated
+        tm.converged_steps = [(t, np.array([t ** 2, t ** 2, -1.0])) for t in [0, 1, 2]]
+        setup.time = 3
+        init_sol = tm.converged_steps[-1][1]
+        setup.nonlinear_residual_norm.side_effect = lambda x: float(abs(x[0] - 9))
+        guess, residual_norm = tm.predict(init_sol)
+        assert np.allclose(guess, [9, 9, -1])
+        assert residual_norm == 0
+        setup.after_newton_iteration.assert_called_once()
+        # Discretized once, at the guess
+        setup.before_newton_iteration.assert_called_once()
+
+        # Linear extrapolation with only two converged steps
+        tm.converged_steps = tm.converged_steps[-2:]
+        guess, _ = tm.predict(init_sol)
+        assert np.allclose(guess, [7, 7, -1])
+
+        # Fall back to the previous state, which must be re-discretized
+        setup.nonlinear_residual_norm.side_effect = lambda x: float(abs(x[0] - 4))
+        guess, residual_norm = tm.predict(init_sol)
+        assert guess is init_sol and residual_norm is None
+        setup.after_newton_iteration.assert_called_with(init_sol)
+
+    def test_reuse_assembled_system(self, cube_root_model, mocker):
+        """Backtrack before the convergence check, and reuse the assembled systems
+
+        The full Newton step from x = (1, 1) overshoots, so the line search halves
+        it. Each trial residual is evaluated with the Jacobian discretized at the
+        trial iterate. The linear solves reuse the systems assembled for the line
+        search.
+        """
+        time_params = TimeStepProtocol.create_protocol([0, 1], [1])
+        newton = NewtonParameters(globalization="line_search", max_iterations=30)
+        tm = TimeMachine(cube_root_model, newton, time_params)
+        assemble = mocker.spy(cube_root_model, "assemble_matrix_rhs")
+        solve = mocker.spy(cube_root_model, "assemble_and_solve_linear_system")
+        check = mocker.spy(cube_root_model, "check_convergence")
+        nonlinear_residual_norm = cube_root_model.nonlinear_residual_norm
+        discretized_at_trial = []
+
+        def residual_norm(x):
+            model = cube_root_model
+            discretized_at_trial.append(np.array_equal(model.linearization, x))
+            return nonlinear_residual_norm(x)
+
+        residual_norm = mocker.patch.object(
+            cube_root_model, "nonlinear_residual_norm", side_effect=residual_norm
+        )
+
+        sol = tm.time_iteration()
+        assert np.allclose(sol, [2, 3])
+        assert solve.call_count > 1
+        assert assemble.call_count == residual_norm.call_count
+        assert residual_norm.call_count > solve.call_count + 1
+        assert all(discretized_at_trial)
+        # The first step, to 1 + 26 / 3 in the second component, is checked after
+        # backtracking
+        first_step = check.call_args_list[0][0][0]
+        assert first_step[1] < 1 + 26 / 6 + 1e-12
+
+    def test_reuse_predictor_assembly(self, cube_root_model, mocker):
+        """ The first solve reuses the system assembled at the extrapolated guess"""
+        time_params = TimeStepProtocol.create_protocol([0, 1], [1])
+        newton = NewtonParameters(predictor_order=1)
+        tm = TimeMachine(cube_root_model, newton, time_params)
+        mocker.patch.object(tm, "predictor_dofs", return_value=np.arange(2))
+        # Linear extrapolation to t = 2 hits the solution (2, 3)
+        tm.converged_steps = [(0, np.array([1.5, 2.5])), (1, np.array([1.75, 2.75]))]
+        cube_root_model.state = tm.converged_steps[-1][1].copy()
+        cube_root_model.iterate = cube_root_model.state.copy()
+        cube_root_model.time = 2.0
+        assemble = mocker.spy(cube_root_model, "assemble_matrix_rhs")
+        discretize = mocker.spy(cube_root_model, "before_newton_iteration")
+
+        sol = tm.time_iteration()
+        assert np.allclose(sol, [2, 3])
+        # The residuals at the state and the guess. The solve assembles nothing.
+        assert assemble.call_count == 2
+        assert discretize.call_count == 1
+
+
 class TestTimeMachinePhasesConstantDt:
     def test_determine_time_step_from_phase(self):
         # Create protocol with two phases.
@@ -100,3 +329,47 @@ class TestTimeMachinePhasesConstantDt:
         # Time step should be adjusted to dt=1 since the suggested dt=1.2 > 1 (= 1 - 0)
         assert np.isclose(time_machine.current_time_step, 0.5)
         assert np.isclose(time_machine.current_time, 2)
+
+
+class TestEisenstatWalker:
+    def test_forcing_terms(self):
+        """ Loose tolerance in early iterations, tight as Newton converges"""
+        forcing = EisenstatWalker.from_newton_parameters(NewtonParameters())
+
+        # First iteration uses the maximal forcing term
+        assert np.isclose(forcing(1.0), forcing.eta_max)
+
+        # Slow convergence keeps the tolerance loose
+        assert np.isclose(forcing(0.9), forcing.eta_max)
+
+        # Quadratic convergence tightens the tolerance
+        etas = [forcing(r) for r in [1e-2, 1e-4, 1e-8]]
+        assert np.all(np.diff(etas) < 0)
+        assert np.isclose(forcing(1e-30), forcing.eta_min)
+
+
+class TestAndersonAcceleration:
+    def test_linear_fixed_point(self):
+        """ Faster convergence than the plain iteration for a linear contraction"""
+        M = np.array([[0.9, 0.2], [0.0, 0.8]])
+        c = np.array([1.0, -1.0])
+        x_star = np.linalg.solve(np.eye(2) - M, c)
+
+        anderson = AndersonAcceleration(depth=2)
+        x = x_plain = np.zeros(2)
+        for _ in range(4):
+            x = anderson(x, M @ x + c)
+            x_plain = M @ x_plain + c
+        assert np.allclose(x, x_star)
+        assert not np.allclose(x_plain, x_star)
+
+    def test_restart(self):
+        """ The history is cleared when the step grows"""
+        anderson = AndersonAcceleration(depth=2)
+        anderson(np.zeros(1), np.ones(1))
+        x = anderson(np.ones(1), 3 * np.ones(1))
+        assert anderson.num_restarts == 1
+        assert np.allclose(x, 3)
+
+        # Disabled
+        assert np.allclose(AndersonAcceleration(depth=0)(np.zeros(1), np.ones(1)), 1)
@@ -1,10 +1,11 @@
 import logging
+from typing import List, Optional, Tuple
 
 import numpy as np
 
 from GTS.isc_modelling.general_model import CommonAbstractModel, NewtonFailure
 from GTS.time_protocols import TimeStepProtocol
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from util import timer
 from pypardiso.pardiso_wrapper import PyPardisoError
 
@@ -16,6 +17,159 @@ class NewtonParameters(BaseModel):
     convergence_tol: float = 1e-10
     divergence_tol: float = 1e5
 
+    # Eisenstat-Walker forcing terms for the linear tolerance (see EisenstatWalker)
+    forcing_max: float = 1e-1
+    forcing_min: float = 1e-10
+    forcing_gamma: float = 0.9
+    forcing_alpha: float = (1 + np.sqrt(5)) / 2
+
+    # Chord (modified Newton) method: Reuse the factorization of the Jacobian until
+    # the contact state changes or the contraction rate exceeds chord_contraction.
+    chord: bool = False
+    chord_contraction: float = 0.5
+
+    # Globalization of the Newton step (see TimeMachine.time_iteration):
+    #   None: full Newton steps.
+    #   "line_search": backtrack along the step, halving it until the nonlinear
+    #       residual norm decreases sufficiently (Armijo condition).
+    #   "damping": scale the step by damping_factor when the contact state changes.
+    #       Convergence is checked for the damped step, so that an oscillating
+    #       contact state does not prevent convergence.
+    globalization: Optional[str] = None
+    line_search_max_backtracks: int = 4
+    line_search_armijo: float = 1e-4
+    damping_factor: float = 0.5
+
+    # Anderson acceleration of the iterates, with the last anderson_depth steps
+    # (see AndersonAcceleration). Disabled if 0. The history is cleared when the
+    # step grows by more than a factor anderson_restart_growth.
+    anderson_depth: int = 0
+    anderson_restart_growth: float = 1.0
+
+    # Predictor for the initial guess of each time step: Extrapolate the pressure,
+    # displacement and mortar displacement from the last predictor_order + 1
+    # converged steps. 0: the previous state, 1: linear, 2: quadratic.
+    # The previous state is used if the predictor increases the residual.
+    predictor_order: int = 0
+
+    @validator("globalization")
+    def validate_globalization(cls, v):  # noqa
+        if v not in (None, "line_search", "damping"):
+            raise ValueError(f"Unknown globalization {v}")
+        return v
+
+
+class EisenstatWalker:
+    """Eisenstat-Walker forcing terms for inexact Newton
+
+    The linear system of Newton iteration k is solved to the tolerance
+        ||F(x_k) + J(x_k) s_k|| <= eta_k ||F(x_k)||,
+    where the forcing term eta_k follows choice 2 of Eisenstat and Walker (1996):
+        eta_k = gamma * (||F(x_k)|| / ||F(x_k-1)||) ^ alpha.
+    The first iteration uses eta_max. To avoid too rapid decrease, eta_k is
+    bounded below by gamma * eta_k-1 ^ alpha whenever this is larger than 0.1.
+    Finally, eta_k is restricted to [eta_min, eta_max].
+
+    Thus, early Newton iterations are solved loosely, and the tolerance
+    tightens as Newton converges.
+
+    Call with the nonlinear residual norm ||F(x_k)|| to get eta_k.
+    """
+
+    def __init__(
+        self,
+        eta_max: float = 1e-1,
+        eta_min: float = 1e-10,
+        gamma: float = 0.9,
+        alpha: float = (1 + np.sqrt(5)) / 2,
+    ):
+        self.eta_max = eta_max
+        self.eta_min = eta_min
+        self.gamma = gamma
+        self.alpha = alpha
+
+        # Forcing term and residual norm of the previous iteration
+        self.eta: Optional[float] = None
+        self.residual_norm: Optional[float] = None
+
+    @classmethod
+    def from_newton_parameters(cls, params: NewtonParameters) -> "EisenstatWalker":
+        return cls(
+            eta_max=params.forcing_max,
+            eta_min=params.forcing_min,
+            gamma=params.forcing_gamma,
+            alpha=params.forcing_alpha,
+        )
+
+    def __call__(self, residual_norm: float) -> float:
+        """ Forcing term for the current iteration"""
+        if self.eta is None or not self.residual_norm:
+            eta = self.eta_max
+        else:
+            eta = self.gamma * (residual_norm / self.residual_norm) ** self.alpha
+            eta_safe = self.gamma * self.eta ** self.alpha
+            if eta_safe > 0.1:
+                eta = max(eta, eta_safe)
+
+        eta = float(np.clip(eta, self.eta_min, self.eta_max))
+        self.eta, self.residual_norm = eta, residual_norm
+        return eta
+
+
+class AndersonAcceleration:
+    """Anderson acceleration of the fixed-point iteration x_k+1 = G(x_k)
+
+    Here, G is one Newton step. With the steps f_k = G(x_k) - x_k, the accelerated
+    iterate is
+        x_k+1 = G(x_k) - sum_i gamma_i (G(x_k-i+1) - G(x_k-i)),
+    where gamma minimizes ||f_k - sum_i gamma_i (f_k-i+1 - f_k-i)|| over the last
+    `depth` differences. As a safeguard, the history is cleared (restarted) if
+    ||f_k|| > restart_growth * ||f_k-1||.
+
+    Call with x_k and G(x_k) to get x_k+1. Use a new instance in each time step.
+    """
+
+    def __init__(self, depth: int, restart_growth: float = 1.0):
+        self.depth = depth
+        self.restart_growth = restart_growth
+
+        # Step and fixed-point map of the previous iteration
+        self.f: Optional[np.ndarray] = None
+        self.g: Optional[np.ndarray] = None
+        # Differences of the steps and fixed-point maps, oldest first
+        self.delta_f: List[np.ndarray] = []
+        self.delta_g: List[np.ndarray] = []
+        self.num_restarts = 0
+
+    @classmethod
+    def from_newton_parameters(cls, params: NewtonParameters) -> "AndersonAcceleration":
+        return cls(
+            depth=params.anderson_depth, restart_growth=params.anderson_restart_growth
+        )
+
+    def __call__(self, x: np.ndarray, g: np.ndarray) -> np.ndarray:
+        """ Accelerated iterate from the iterate x and the Newton update g = G(x)"""
+        if self.depth == 0:
+            return g
+        f = g - x
+        if self.f is not None:
+            if np.linalg.norm(f) > self.restart_growth * np.linalg.norm(self.f):
+                logger.info("Anderson acceleration diverges. Restart.")
+                self.delta_f, self.delta_g = [], []
+                self.num_restarts += 1
+            else:
+                self.delta_f.append(f - self.f)
+                self.delta_g.append(g - self.g)
+                if len(self.delta_f) > self.depth:
+                    self.delta_f.pop(0)
+                    self.delta_g.pop(0)
+        self.f, self.g = f, g
+
+        if not self.delta_f:
+            return g
+        gamma = np.linalg.lstsq(np.column_stack(self.delta_f), f, rcond=None)[0]
+        return g - np.column_stack(self.delta_g) @ gamma
+
 
 class TimeMachine:
     def __init__(
@@ -37,9 +191,14 @@ class TimeMachine:
         # Max time iteration attempts
         self.k_newton_max = max_newton_failure_retries + 1
 
+        # Times and states of the last converged steps, for the predictor
+        self.converged_steps: List[Tuple[float, np.ndarray]] = []
+
     @timer(logger)
-    def iteration(self, tol):
-        sol = self.setup.assemble_and_solve_linear_system(tol)
+    def iteration(self, tol, x0=None, reuse_factorization=False):
+        sol = self.setup.assemble_and_solve_linear_system(
+            tol, x0=x0, reuse_factorization=reuse_factorization
+        )
         return sol
 
     @timer(logger)
@@ -54,24 +213,58 @@ class TimeMachine:
         iteration_counter = 0
 
         init_sol: np.ndarray = setup.get_state_vector()
-        prev_sol = init_sol
-        sol = init_sol
+        if not self.converged_steps:
+            self.converged_steps.append((self.current_time, init_sol.copy()))
+        # Nonlinear residual norm at prev_sol, if the system is assembled there
+        prev_sol, residual_norm = self.predict(init_sol)
+        sol = prev_sol
         errors = []
-        error_norm = 1
+        forcing = EisenstatWalker.from_newton_parameters(self.newton_params)
+        anderson = AndersonAcceleration.from_newton_parameters(self.newton_params)
+        contact_state = None
+        globalization = self.newton_params.globalization
 
         for it in range(self.newton_params.max_iterations):
             logger.info(
                 f"Newton iteration number {it} of {self.newton_params.max_iterations}"
             )
-            # Re-discretize non-linear terms
-            setup.before_newton_iteration()
+            # Re-discretize non-linear terms, unless the predictor or the line search
+            # did so. The system they assembled is reused by the solve.
+            if residual_norm is None:
+                setup.before_newton_iteration()
+                if globalization == "line_search":
+                    residual_norm = setup.nonlinear_residual_norm(prev_sol)
+
+            # Chord method: decide whether to keep the previous factorization
+            prev_contact_state, contact_state = contact_state, setup.contact_state()
+            reuse = self.reuse_factorization(errors, contact_state, prev_contact_state)
+
+            # Solve, with linear tolerance from the nonlinear residual at prev_sol
+            sol = self.iteration(forcing, x0=prev_sol, reuse_factorization=reuse)
+
+            # Damping: shorten the step if the contact state changed
+            damped = (
+                globalization == "damping"
+                and prev_contact_state is not None
+                and not np.array_equal(contact_state, prev_contact_state)
+            )
+            if damped:
+                logger.info(
+                    f"Contact state changed. Damp the Newton step by "
+                    f"{self.newton_params.damping_factor}."
+                )
+                sol = prev_sol + self.newton_params.damping_factor * (sol - prev_sol)
 
-            # Solve
-            lin_tol = np.minimum(1e-4, error_norm)
-            sol = self.iteration(lin_tol)
+            # Anderson acceleration of the iterate update
+            sol = anderson(prev_sol, sol)
 
-            # After iteration
-            setup.after_newton_iteration(sol)
+            # Line search: backtrack along the step, if needed. This also updates
+            # the iterate, see after_newton_iteration.
+            if globalization == "line_search":
+                sol, residual_norm = self.line_search(prev_sol, sol, residual_norm)
+            else:
+                setup.after_newton_iteration(sol)
+                residual_norm = None
 
             # Check convergence
             error_norm, is_converged, is_diverged = setup.check_convergence(
@@ -84,6 +277,8 @@ class TimeMachine:
                 setup.after_newton_failure(sol, errors, iteration_counter)
             elif is_converged:
                 setup.after_newton_convergence(sol, errors, iteration_counter)
+                self.converged_steps.append((setup.time, sol.copy()))
+                del self.converged_steps[:-3]
                 return sol
 
             iteration_counter += 1
@@ -91,6 +286,146 @@ class TimeMachine:
         # If max newton iterations reached without convergence, then:
         setup.after_newton_failure(sol, errors, iteration_counter)
 
+    def predict(self, init_sol: np.ndarray) -> Tuple[np.ndarray, Optional[float]]:
+        """Initial guess of the time step, see NewtonParameters.predictor_order
+
+        The guess is extrapolated to the new time, setup.time, from the last
+        converged steps. If the nonlinear residual norm at the extrapolated guess
+        is not below the norm at the previous state, init_sol, the previous state
+        is used. The iterate is set to the returned guess.
+
+        The residual at init_sol is assembled with the discretization of the last
+        iteration. The non-linear terms are re-discretized once, at the extrapolated
+        guess. If the guess is accepted, the system assembled there is reused by the
+        first Newton iteration.
+
+        Returns
+        -------
+        guess : np.ndarray
+            initial guess
+        residual_norm : float, Optional
+            nonlinear residual norm at the guess, if the system is assembled there.
+            None if the non-linear terms must be re-discretized.
+        """
+        setup = self.setup
+        order = min(self.newton_params.predictor_order, len(self.converged_steps) - 1)
+        if order < 1:
+            return init_sol, None
+
+        times, states = zip(*self.converged_steps[-(order + 1) :])
+        weights = extrapolation_weights(np.array(times), setup.time)
+        dofs = self.predictor_dofs()
+        guess = init_sol.copy()
+        guess[dofs] = sum(w * state[dofs] for w, state in zip(weights, states))
+
+        residual_norm_state = setup.nonlinear_residual_norm(init_sol)
+        setup.after_newton_iteration(guess)
+        setup.before_newton_iteration()
+        residual_norm = setup.nonlinear_residual_norm(guess)
+        if residual_norm < residual_norm_state:
+            logger.info(
+                f"Predictor of order {order}. Initial residual "
+                f"{residual_norm_state:.2e} -> {residual_norm:.2e}"
+            )
+            return guess, residual_norm
+
+        logger.info(
+            f"Predictor increases the initial residual from "
+            f"{residual_norm_state:.2e} to {residual_norm:.2e}. Use the previous state."
+        )
+        setup.after_newton_iteration(init_sol)
+        return init_sol, None
+
+    def predictor_dofs(self) -> np.ndarray:
+        """ Dofs of the pressure, displacement and mortar displacement variables"""
+        setup = self.setup
+        names = [
+            "scalar_variable",
+            "displacement_variable",
+            "mortar_displacement_variable",
+        ]
+        dofs = [
+            setup.dof_layout.dofs(getattr(setup, name))
+            for name in names
+            if hasattr(setup, name)
+        ]
+        return np.concatenate(dofs) if dofs else np.zeros(0, dtype=int)
+
+    def line_search(
+        self, last_sol: np.ndarray, sol: np.ndarray, last_residual_norm: float
+    ) -> Tuple[np.ndarray, float]:
+        """Backtracking line search along the Newton step
+
+        The step from the iterate last_sol to the solution sol of the linear system
+        is halved until
+            ||F(x)|| <= (1 - c * lambda) ||F(last_sol)||,
+        for x = last_sol + lambda * (sol - last_sol), where c is
+        newton_params.line_search_armijo. If this fails after
+        newton_params.line_search_max_backtracks halvings, the shortest step is
+        taken.
+
+        The non-linear terms are re-discretized at each trial iterate, so the
+        residuals are those of the non-linear problem. On return, the iterate is x,
+        the non-linear terms are discretized at x, and the system assembled there is
+        reused by the next linear solve.
+
+        Returns
+        -------
+        x : np.ndarray
+            accepted iterate
+        residual_norm : float
+            nonlinear residual norm at x
+        """
+        params = self.newton_params
+        setup = self.setup
+        step = sol - last_sol
+        x, lam = sol, 1.0
+        setup.after_newton_iteration(x)
+        setup.before_newton_iteration()
+        residual_norm = setup.nonlinear_residual_norm(x)
+        for _ in range(params.line_search_max_backtracks):
+            sufficient = (1 - params.line_search_armijo * lam) * last_residual_norm
+            if residual_norm <= sufficient:
+                break
+            lam /= 2
+            x = last_sol + lam * step
+            setup.after_newton_iteration(x)
+            setup.before_newton_iteration()
+            residual_norm = setup.nonlinear_residual_norm(x)
+
+        if lam < 1:
+            logger.info(
+                f"Line search step length {lam}. Nonlinear residual "
+                f"{last_residual_norm:.2e} -> {residual_norm:.2e}"
+            )
+        return x, residual_norm
+
+    def reuse_factorization(
+        self,
+        errors: List[float],
+        contact_state: np.ndarray,
+        prev_contact_state: Optional[np.ndarray],
+    ) -> bool:
+        """Whether the next iteration is a chord step with the previous factorization
+
+        The factorization is renewed at the first iteration of each time step,
+        if the contact state (open, sticking, sliding) changed, or if the last
+        iteration contracted the error by less than newton_params.chord_contraction.
+        """
+        params = self.newton_params
+        if not params.chord or prev_contact_state is None:
+            return False
+        if not np.array_equal(contact_state, prev_contact_state):
+            logger.info("Contact state changed. Refactorize the Jacobian.")
+            return False
+        if len(errors) >= 2 and errors[-1] > params.chord_contraction * errors[-2]:
+            logger.info(
+                f"Slow contraction ({errors[-1] / errors[-2]:.2f}). "
+                f"Refactorize the Jacobian."
+            )
+            return False
+        return True
+
     @timer(logger)
     def run_simulation(self, prepare_simulation=True):
         """ Run time-dependent non-linear simulation"""
@@ -123,6 +458,7 @@ class TimeMachine:
                         f"Newton iteration failed. Error type {type(e)}, msg: {e}"
                     )
                     # If Newton method failed, reset the iterate to STATE variables.
+                    # With state buffers, this is a single copy (bind_state_buffers).
                     init_sol = setup.get_state_vector()
                     setup.update_state(init_sol)
                     newton_failure = True
@@ -212,6 +548,19 @@ class TimeMachine:
         return current_time_step
 
 
+def extrapolation_weights(times: np.ndarray, time: float) -> np.ndarray:
+    """Weights of the Lagrange polynomial through the given times, evaluated at time
+
+    The polynomial p with p(times[i]) = values[i] is p(time) = sum_i w_i values[i].
+    """
+    weights = np.ones(times.size)
+    for i in range(times.size):
+        for j in range(times.size):
+            if j != i:
+                weights[i] *= (time - times[j]) / (times[i] - times[j])
+    return weights
+
+
 class TimeMachinePhasesConstantDt(TimeMachine):
     """ Time machine with constant time step per phase"""
 